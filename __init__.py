@@ -2,25 +2,51 @@
 pyre - A Regular Expression Engine Based on Derivatives
 """
 
+import functools
+import threading
+
 from .dfa import compile as _compile_dfa, DFA
 from .parser import Parser
+from .regex import Regex
 
 
 def compile(pattern):
     """
-    Compile a regex pattern string into a DFA.
+    Compile a regex pattern string, or an already parsed expression, into
+    a DFA.
     """
     if isinstance(pattern, DFA):
         return pattern
     elif isinstance(pattern, str):
-        parser = Parser()
-        expr = parser.parse(pattern)
-        if parser.errors:
-            raise ValueError(f'Invalid regex pattern: {repr(pattern)}')
-        return _compile_dfa(expr)
+        return _compile_str(pattern)
+    elif isinstance(pattern, Regex):
+        return _compile_dfa(pattern)
 
     raise TypeError(f"Unsupported pattern type: {type(pattern).__name__}")
 
+# A Parser can be reused but not shared between threads, so each thread
+# keeps its own rather than building one per pattern
+#
+_local = threading.local()
+
+def _parser():
+    try:
+        return _local.parser
+    except AttributeError:
+        _local.parser = Parser()
+        return _local.parser
+
+# DFAs are never modified by matching, so repeated calls with the same
+# pattern string can share one.
+#
+@functools.lru_cache(maxsize=512)
+def _compile_str(pattern):
+    parser = _parser()
+    expr = parser.parse(pattern)
+    if parser.errors:
+        raise ValueError(f'Invalid regex pattern: {repr(pattern)}')
+    return _compile_dfa(expr)
+
 def fullmatch(pattern, string):
     return compile(pattern).fullmatch(string)
 
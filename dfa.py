@@ -2,6 +2,8 @@
 # dfa.py
 #
 
+import bisect
+import functools
 import logging
 LOG = logging.getLogger(__file__)
 
@@ -10,32 +12,46 @@ from . import regex
 from . import event
 from .event import Event
 
-from collections import namedtuple
-DFAStep = namedtuple("DFAStep", "index char prev_state state goto")
+from collections import deque
+
+# search() translates the input for start byte skipping this many bytes at
+# a time
+#
+SKIP_BLOCK = 1 << 16
+
+# Flags in DFA.actions, see DFA._flatten()
+#
+ACT_ACCEPT = 1
+ACT_DEAD = 2
+ACT_EVENT_SHIFT = 2
+
+# record() packs the action above the next state number, see specialize()
+#
+STEP_ACT_SHIFT = 32
 
 # Manage state transition information. In addition to keeping track of the next
 # state, we will also house info about which particular states were used to
 # compute the transition, generally a RegexDot or RegexSym.
 #
 class Goto:
-    def __init__(self, _next, _states=None):
-        self._next = _next
-        self._states = _states if _states is not None else set()
-        self._events = None
-
-    @property
-    def events(self):
-        if self._events is None:
-            _events = set()
+    __slots__ = ('_next', '_states', 'events', '_opens', '_closes')
 
-            for x in self._states:
-                if x.ismarker:
-                    for y in x.events:
-                        _events.add(y)
+    def __init__(self, _next, _states=None, events=frozenset()):
+        self._next = _next
+        self._states = _states if _states is not None else frozenset()
 
-            self._events = _events
+        # Capture events of the marker states in _states, gathered once by
+        # the DFA at compile time. A plain attribute, as they never change
+        # once the Goto is built
+        #
+        self.events = events
 
-        return self._events
+        # Group ids of the events split by kind, filled in by the DFA once
+        # the transition is final so GroupInfo.step never has to look at
+        # Event objects per character
+        #
+        self._opens = ()
+        self._closes = ()
 
     def __str__(self):
         return f'Goto(next={self._next.name} events={self.events})'
@@ -46,94 +62,404 @@ class Goto:
 
 class DFA:
     def __init__(self, expr):
-        self.states = set()
-        self.initial = DFAState(expr)
+        self.states = []
 
-        todo = {self.initial}
+        # States are keyed on the identity of their regex. Regex nodes are
+        # hash-consed (see regex.Regex._instance) so identity is equivalence.
+        #
+        self.empty = DFAState(regex.RegexEmpty())
+        dead = Goto(self.empty)
+        seen = {id(self.empty.regex): self.empty}
+
+        # Transitions with the same target and events are interchangeable,
+        # so they are interned per compile and shared across states.
+        #
+        interned = {(self.empty, frozenset()): dead}
+
+        # Likewise each distinct event set is kept once, along with its
+        # split into OPEN and CLOSE events
+        #
+        event_sets = {frozenset(): (frozenset(), (), ())}
+
+        def split_events(events):
+            """ (events, OPEN group ids, CLOSE group ids), kept once per set """
+            split = event_sets.get(events)
+            if split is None:
+                split = event_sets[events] = (
+                    events,
+                    group_ids(events, event.OPEN),
+                    group_ids(events, event.CLOSE),
+                )
+            return split
+
+        self.initial = seen.setdefault(id(expr), DFAState(expr))
+
+        todo = deque([self.initial])
+
+        # Messages below are only built when DEBUG is on; the regex reprs
+        # they format can be costly
+        #
+        debug = LOG.isEnabledFor(logging.DEBUG)
 
         while todo:
-            current = todo.pop()
+            current = todo.popleft()
             current.name = f'q{len(self.states)}'
-            self.states.add(current)
+            self.states.append(current)
 
-            LOG.debug(f'Current state {current.name}: {current}')
+            if debug:
+                LOG.debug('Current state %s: %s', current.name, current)
 
-            markers = current.regex.prefix_markers()
-            events = set()
-            for marker in markers:
-                events |= set(marker.events)
+            # The events of a match ending in this state, and the CLOSE
+            # group ids among them, are worked out once here rather than
+            # at the end of every match
+            #
+            events = frozenset(
+                e for marker in current.regex.prefix_markers() for e in marker.events
+            )
+            current.prefix_events, _, current.prefix_closes = split_events(events)
 
-            current.prefix_events = events
+            classes = [c for c in current.regex.charset.get_int_sets() if c]
 
-            classes = current.regex.charset.get_int_sets()
+            # Each byte maps to a class id in `cls`, which indexes `gotos`.
+            # Slot 0 is the dead transition unless 256 singleton classes
+            # already cover the whole alphabet (and would overflow a byte).
+            #
+            cls = bytearray(256)
+            gotos = [] if len(classes) == 256 else [dead]
 
             for charset in classes:
-                if charset:
-                    char = chr(charset[0][0])
+                char = chr(charset[0][0])
+
+                accept = set()
+                derived = current.regex.derive(char, accept)
+
+                _next = seen.get(id(derived))
+                if _next is None:
+                    _next = seen[id(derived)] = DFAState(derived)
+                    todo.append(_next)
+
+                if debug:
+                    LOG.debug('Derivative of %s of %r => %s', current.name, char, _next)
+                    LOG.debug('Transition for %s is %s', [regex.CharSet._fmt_char(x) for x in charset[0]], accept)
+
+                events = frozenset(e for x in accept if x.ismarker for e in x.events)
+
+                key = (_next, events)
+                if key in interned:
+                    goto = interned[key]
+                else:
+                    events, opens, closes = split_events(events)
+                    goto = interned[key] = Goto(_next, frozenset(accept), events)
+                    goto._opens = opens
+                    goto._closes = closes
 
-                    accept = set()
-                    _next = DFAState(current.regex.derive(char, accept))
+                if debug:
+                    LOG.debug('Goto events: %s', goto.events)
 
-                    LOG.debug(f'Derivative of {current.name} of {repr(char)} => {_next}')
-                    LOG.debug(f'Transition for {[regex.CharSet._fmt_char(x) for x in charset[0]]} is {accept}')
+                if goto is dead and gotos and gotos[0] is dead:
+                    continue
 
-                    goto = Goto(_next, accept)
+                index = len(gotos)
+                gotos.append(goto)
 
-                    LOG.debug(f'Goto events: {goto.events}')
+                for rng in charset:
+                    cls[rng[0]:rng[-1] + 1] = bytes((index,)) * (rng[-1] + 1 - rng[0])
 
-                    for rng in charset:
-                        for code in range(rng[0], rng[-1] + 1):
-                            current.goto[code] = goto
+            current.cls = bytes(cls)
+            current.gotos = tuple(gotos)
 
-                    if _next not in self.states:
-                        todo.add(_next)
+            # The dead state is always part of the DFA, numbered last
+            #
+            if not todo and self.empty.name is None:
+                todo.append(self.empty)
 
-        self.states.add(DFAState.empty())
-        if DFAState.empty().name is None:
-            DFAState.empty().name = f'q{len(self.states)}'
+        self._minimize()
+        self._flatten()
+        self._compact()
 
-        if LOG.getEffectiveLevel() == logging.DEBUG:
-            for state in sorted(self.states, key=lambda x: x.name):
+        if debug:
+            for state in self.states:
                 label = state.name
 
-                if state.regex.isnullable():
+                if state.isnullable:
                     label = util.highlight(label)
 
                 print(f'{label}: {state} (events={state.prefix_events})')
 
                 for mask in sorted(state.regex.charset.masks):
                     lsb_pos = (mask & -mask).bit_length() - 1
-                    goto = state.goto[lsb_pos]
+                    goto = state.goto(lsb_pos)
                     print(f"    {regex.CharSet.fmt_mask(mask)} {goto}")
 
-        LOG.debug('Total DFA states: %d' % len(self.states))
-        LOG.debug('Total RE instances: %d' % len(regex.Regex._instance))
+            LOG.debug('Total DFA states: %d', len(self.states))
+            LOG.debug('Total RE instances: %d', len(regex.Regex._instance))
+
+
+    def _minimize(self):
+        """
+        Merge equivalent states with Hopcroft's partition refinement.
+
+        States start out grouped by everything observable without reading
+        further input: nullability, prefix events, and the events on each
+        outgoing transition. Groups are then split until every member of a
+        group moves into the same group on every byte. The initial and dead
+        states represent their groups so both keep their roles. If a pattern
+        can never match they are one group, and the initial state stands for
+        it marked dead, so scans still stop on it at once.
+        """
+        states = self.states
+        number = {state: i for i, state in enumerate(states)}
+
+        rows = []
+        blocks = {}
+        block_of = []
+        # The per-byte expansions here and in _flatten are done with map()
+        # and zip() over the class tables, which keeps the 256-way loops
+        # out of the interpreter
+        #
+        for state in states:
+            targets = [number[goto._next] for goto in state.gotos]
+            rows.append(list(map(targets.__getitem__, state.cls)))
+
+            events = [goto.events for goto in state.gotos]
+            key = (
+                state.isnullable,
+                state.prefix_events,
+                tuple(map(events.__getitem__, state.cls)),
+            )
+            block_of.append(blocks.setdefault(key, len(blocks)))
+
+        if len(blocks) == len(states):
+            return
+
+        # Bytes whose transitions agree in every state are one symbol
+        #
+        columns = {}
+        for code, column in enumerate(zip(*rows)):
+            columns.setdefault(column, code)
+
+        inverse = []
+        for code in columns.values():
+            sources = {}
+            for i, row in enumerate(rows):
+                sources.setdefault(row[code], []).append(i)
+            inverse.append(sources)
+
+        partition = [set() for _ in blocks]
+        for i, b in enumerate(block_of):
+            partition[b].add(i)
+
+        work = list(range(len(partition)))
+        pending = [True] * len(partition)
+
+        while work:
+            a = work.pop()
+            pending[a] = False
+            splitter = list(partition[a])
+
+            for sources in inverse:
+                touched = {}
+                for t in splitter:
+                    for i in sources.get(t, ()):
+                        touched.setdefault(block_of[i], set()).add(i)
+
+                for b, inside in touched.items():
+                    if len(inside) == len(partition[b]):
+                        continue
+
+                    outside = partition[b] - inside
+                    partition[b] = inside
+
+                    split = len(partition)
+                    partition.append(outside)
+                    for i in outside:
+                        block_of[i] = split
+
+                    if pending[b]:
+                        pending.append(True)
+                        work.append(split)
+                    else:
+                        smaller = split if len(outside) <= len(inside) else b
+                        pending.append(smaller == split)
+                        pending[b] = smaller == b
+                        work.append(smaller)
+
+        if len(partition) == len(states):
+            return
+
+        rep = [None] * len(partition)
+        for state in (self.initial, self.empty, *states):
+            b = block_of[number[state]]
+            if rep[b] is None:
+                rep[b] = state
+
+        canon = {state: rep[block_of[i]] for i, state in enumerate(states)}
+
+        self.states = [state for state in states if canon[state] is state]
+        self.empty = canon[self.empty]
+        self.empty.isempty = True
+
+        for i, state in enumerate(self.states):
+            state.name = f'q{i}'
+            for goto in state.gotos:
+                goto._next = canon[goto._next]
+
+
+    def _flatten(self):
+        """
+        Number the states (initial state is 0) and lay the DFA out as flat
+        tables for the scan kernel:
+
+          - classes: bytes.translate() table mapping each byte to its class.
+                     Bytes in one class behave the same in every state, so
+                     the tables below have one column per class rather than
+                     per byte, and the input is translated once per call.
+          - trans:   next state number at [state][class]
+          - dead:    1 if the state is the empty (dead) state
+          - accept:  1 if the state is nullable
+
+        and for capture tracking:
+
+          - actions:     what taking the transition at [state][class] does:
+                         ACT_DEAD and ACT_ACCEPT for the target state, plus
+                         an id into `events` shifted by ACT_EVENT_SHIFT. A
+                         plain step is 0 and costs one truth test.
+          - events:      (opens, closes) group ids per id; id 0 has no
+                         events
+          - end_closes:  group ids of the CLOSE prefix events to apply when
+                         a match ends in the state
+
+        skip_table is a bytes.translate() table mapping each byte to 1 if it
+        leads the initial state straight to the dead state, 0 otherwise.
+
+        prefix is the literal every match must start with: the bytes read
+        from the initial state while exactly one byte stays alive, up to
+        the first nullable state.
+
+        has_events records whether any transition or state carries capture
+        events; without them a match needs no per-step group tracking.
+        num_groups is the highest group id plus one, the size of GroupInfo,
+        and group_names maps the ids of named groups to their names.
+        """
+        order = self.states
+        number = {state: i for i, state in enumerate(order)}
+
+        # Bytes with the same column of class ids across all states share a
+        # class; `first` holds one byte of each class
+        #
+        columns = {}
+        classes = bytearray(256)
+        first = []
+        for code, column in enumerate(zip(*(state.cls for state in order))):
+            if column not in columns:
+                columns[column] = len(first)
+                first.append(code)
+            classes[code] = columns[column]
+
+        self.classes = bytes(classes)
+
+        trans = []
+        actions = []
+        events = {((), ()): 0}
+        for state in order:
+            cls = [state.cls[c] for c in first]
+
+            gotos = [number[goto._next] for goto in state.gotos]
+            trans.append(tuple(map(gotos.__getitem__, cls)))
+
+            acts = [
+                events.setdefault((goto._opens, goto._closes), len(events)) << ACT_EVENT_SHIFT
+                | (ACT_DEAD if goto._next.isempty else 0)
+                | (ACT_ACCEPT if goto._next.isnullable else 0)
+                for goto in state.gotos
+            ]
+            actions.append(tuple(map(acts.__getitem__, cls)))
+
+        self.trans = tuple(trans)
+        self.actions = tuple(actions)
+        self.events = tuple(events)
+        self.end_closes = tuple(state.prefix_closes for state in order)
+        self.dead = bytes(state.isempty for state in order)
+        self.accept = bytes(state.isnullable for state in order)
+        self.skip_table = bytes(self.dead[self.trans[0][x]] for x in self.classes)
+
+        prefix = bytearray()
+        state = 0
+        visited = {state}
+        while not self.accept[state]:
+            row = self.trans[state]
+            live = [code for code, x in enumerate(self.classes) if not self.dead[row[x]]]
+            if len(live) != 1:
+                break
+
+            prefix.append(live[0])
+            state = row[self.classes[live[0]]]
+            if state in visited:
+                break
+            visited.add(state)
+
+        self.prefix = bytes(prefix)
+        self.has_events = any(
+            state.prefix_events or any(goto.events for goto in state.gotos)
+            for state in order
+        )
+
+        all_events = {e for state in order for e in state.prefix_events}
+        all_events.update(e for state in order for goto in state.gotos for e in goto.events)
+        self.num_groups = max((e.gid for e in all_events), default=0) + 1
+        self.group_names = {e.gid: e.name for e in all_events if e.name}
+
+        (self._scan_kernel, self._scan_all_kernel,
+         self._record_kernel, self._record_all_kernel) = specialize(
+            self.trans, self.accept, self.dead, self.actions
+        )
+
+
+    def _compact(self):
+        """
+        Once the flat tables are built the per-state byte tables are only
+        needed by run() and the debug dump. Replace each with its ranges of
+        bytes that share a Goto, which DFAState.goto() bisects.
+        """
+        for state in self.states:
+            cls = state.cls
+            ranges = []
+            lo = 0
+            for code in range(1, 257):
+                if code == 256 or cls[code] != cls[lo]:
+                    ranges.append((lo, code - 1, state.gotos[cls[lo]]))
+                    lo = code
+
+            state.goto_ranges = tuple(ranges)
+            state.bounds = tuple(rng[0] for rng in ranges)
+            state.cls = None
+
+
+    def _classify(self, text):
+        """ `text` as bytes (see _bytes()) translated to byte classes """
+        return _bytes(text).translate(self.classes)
+
+
+    def _scan(self, cbuf, offset, *, greedy=True):
+        return self._scan_kernel(cbuf, offset, greedy)
 
 
     def run(self, text, index=0):
         """
         Iterate over `text[index:]`.
 
-        Yields DFAStep(index, char, prev_state, state, goto)
+        Yields (index, state, goto) tuples
         where:
-          - prev_state: state before reading char
-          - state:      state after reading char
+          - state:      state after reading text[index]
           - goto:       the Goto object used
         """
+        buf = _bytes(text)
         state = self.initial
-        for i in range(index, len(text)):
-            ch = text[i]
-            goto = state.goto[ord(ch)]
-            _next = goto._next
-
-            yield DFAStep(
-                index=i,
-                char=ch,
-                prev_state=state,
-                state=_next,
-                goto=goto,
-            )
-            state = _next
+        for i in range(index, len(buf)):
+            goto = state.goto(buf[i])
+            state = goto._next
+
+            yield i, state, goto
 
 
     def fullmatch(self, text):
@@ -147,25 +473,39 @@ class DFA:
                 {group_id: [(start, end), ...]}
             where start/end are 0-based indices into `text`, end-exclusive.
         """
-        group_info = GroupInfo()
+        cbuf = self._classify(text)
 
-        LOG.debug(f'Match: {self.initial} against {text}')
+        if not self.has_events:
+            if cbuf:
+                matched = self._scan(cbuf, 0) == len(cbuf)
+            else:
+                matched = self.accept[0]
 
-        state = self.initial
+            return {0: [(0, len(text))]} if matched else {}
 
-        for step in self.run(text):
-            state = step.state
-            LOG.debug(f'Match: Step {step}')
+        group_info = GroupInfo(self.num_groups, self.group_names)
 
-            # Dead state
-            #
-            if state.regex.isempty:
-                return {}
+        LOG.debug('Match: %s against %s', self.initial, text)
+
+        group_step = group_info.step
+        trans, actions, events = self.trans, self.actions, self.events
+        state = 0
+
+        for i, code in enumerate(cbuf):
+            act = actions[state][code]
+            state = trans[state][code]
+
+            if act:
+                # Dead state
+                #
+                if act & ACT_DEAD:
+                    return {}
 
-            # Track capture groups
-            group_info.step(step.index, step.goto.events)
+                # Track capture groups
+                if act >> ACT_EVENT_SHIFT:
+                    group_step(i, *events[act >> ACT_EVENT_SHIFT])
 
-        if not state.regex.isnullable():
+        if not self.accept[state]:
             return {}
 
         end_index = len(text)
@@ -178,49 +518,81 @@ class DFA:
 
 
     def match(self, text, *, greedy=True):
-        return self._run_from(text, 0, greedy=greedy)
+        return self._run_from(self._classify(text), 0, greedy=greedy)
 
 
-    def _run_from(self, text, offset, *, greedy=True):
+    def _run_from(self, cbuf, offset, *, greedy=True):
         """
-        Single pass: run DFA from offset, collect capture groups, track match end.
+        Single pass: run DFA over the classified input `cbuf` (see
+        _classify()) from offset, collect capture groups, track match end.
         Stops when we hit empty state. Match end is the latest nullable index.
         Returns (end_index, groups); (None, {}) if no match.
         """
-        group_info = GroupInfo()
-        last_index = None
-        last_state = None
-
-        for step in self.run(text, index=offset):
-            state = step.state
+        if not self.has_events:
+            last_index = self._scan(cbuf, offset, greedy=greedy)
+            if last_index is None:
+                return None, {}
+            return last_index, {0: [(offset, last_index)]}
+
+        trail = []
+        last_index, last_state, last_len = self._record_kernel(cbuf, offset, greedy, trail)
+        if last_index is None:
+            return None, {}
 
-            if state.regex.isempty:
-                break
+        group_info = GroupInfo(self.num_groups, self.group_names)
+        self._replay(group_info, last_index, last_state, trail, 0, last_len)
 
-            group_info.step(step.index, step.goto.events)
+        return last_index, group_info.finalize(offset, last_index)
 
-            if state.regex.isnullable():
-                last_index = step.index + 1
-                last_state = state
-                if not greedy:
-                    break
 
-        if last_index is None:
-            return None, {}
+    def _replay(self, group_info, last_index, last_state, trail, start, stop):
+        """
+        Feed trail[start:stop] from the record() kernel, flat (index, event
+        id) pairs, to `group_info`. The match itself is left open so callers
+        can accumulate several matches into one GroupInfo.
+        """
+        group_step = group_info.step
+        events = self.events
+        for k in range(start, stop, 2):
+            group_step(trail[k], *events[trail[k + 1]])
 
-        close_events = {e for e in last_state.prefix_events if e.kind == event.CLOSE}
-        if close_events:
-            group_info.step(last_index, close_events)
+        closes = self.end_closes[last_state]
+        if closes:
+            group_step(last_index, (), closes)
 
-        return last_index, group_info.finalize(offset, last_index)
+    def _candidates(self, buf):
+        """
+        Yield the offsets in `buf` a match can start at, in order. Known bad
+        start bytes are skipped with bytes.find(): on buf itself for a
+        literal prefix, otherwise on buf translated through skip_table, one
+        block at a time so an early match doesn't pay for a skip_table pass
+        over the rest of the input. That is the only pass saved: the kernels
+        index the class translation of the whole input, which search() makes
+        up front.
+        """
+        n = len(buf)
 
-    # Skip over known bad start characters
-    #
-    def _skip(self, s, offset):
-        n = len(s)
-        while offset < n and self.initial.goto[ord(s[offset])]._next.regex.isempty:
-            offset += 1
-        return offset
+        # Even a single byte prefix is worth it: bytes.find() of one byte is
+        # a memchr(), which needs no translated copy of the input
+        #
+        if self.prefix:
+            offset = buf.find(self.prefix)
+            while offset >= 0:
+                yield offset
+                offset = buf.find(self.prefix, offset + 1)
+
+        elif 1 in self.skip_table:
+            for start in range(0, n, SKIP_BLOCK):
+                block = buf[start:start + SKIP_BLOCK].translate(self.skip_table)
+                offset = block.find(0)
+                while offset >= 0:
+                    yield start + offset
+                    offset = block.find(0, offset + 1)
+
+        # No byte rules out a start, so translating would buy nothing
+        #
+        else:
+            yield from range(n)
 
 
     def search(self, text, *, greedy=True, all=False):
@@ -238,40 +610,67 @@ class DFA:
             - otherwise returns {group_id: [(start, end), ...]} where each
               (start, end) is one non-overlapping match for that group.
         """
-        n = len(text)
-        offset = 0
+        buf = _bytes(text)
+        cbuf = buf.translate(self.classes)
 
         if not all:
-            while offset < n:
-                offset = self._skip(text, offset)
-                if offset >= n:
-                    break
-                end_index, groups = self._run_from(text, offset, greedy=greedy)
-                if groups:
-                    return groups
-                offset += 1
+            # Each candidate is tried in a single pass; only the one that
+            # matches pays for group tracking, by replaying its trail
+            #
+            if not self.has_events:
+                scan = self._scan_kernel
+                for offset in self._candidates(buf):
+                    end_index = scan(cbuf, offset, greedy)
+                    if end_index is not None:
+                        return {0: [(offset, end_index)]}
+                return {}
+
+            # One trail list is reused; a failed candidate just clears it
+            #
+            record = self._record_kernel
+            trail = []
+            for offset in self._candidates(buf):
+                end_index, end_state, end_len = record(cbuf, offset, greedy, trail)
+                if end_index is not None:
+                    group_info = GroupInfo(self.num_groups, self.group_names)
+                    self._replay(group_info, end_index, end_state, trail,
+                                 0, end_len)
+                    return group_info.finalize(offset, end_index)
+                trail.clear()
             return {}
 
-        all_groups = {}
-        while offset < n:
-            offset = self._skip(text, offset)
-            if offset >= n:
-                break
-            end_index, groups = self._run_from(text, offset, greedy=greedy)
-            if not groups:
-                offset += 1
-                continue
-            for gid, intervals in groups.items():
-                all_groups.setdefault(gid, []).extend(intervals)
-            offset = end_index
+        # The kernel finds candidates itself: `needle` in `haystack` is
+        # either the literal prefix in buf or a zero byte in buf translated
+        # through skip_table (see _candidates())
+        #
+        if self.prefix:
+            haystack, needle = buf, self.prefix
+        else:
+            haystack, needle = buf.translate(self.skip_table), 0
 
-        return all_groups
+        if not self.has_events:
+            spans = self._scan_all_kernel(cbuf, haystack, needle, greedy)
+            return {0: spans} if spans else {}
+
+        matches, trail = self._record_all_kernel(cbuf, haystack, needle, greedy)
+        if not matches:
+            return {}
+
+        # Replay each match's slice of the shared trail into one GroupInfo
+        #
+        group_info = GroupInfo(self.num_groups, self.group_names)
+        for start, end_index, end_state, lo, hi in matches:
+            self._replay(group_info, end_index, end_state, trail, lo, hi)
+            group_info.end_match(start, end_index)
+
+        return group_info.groups()
 
 
     def lex(self, text):
+        cbuf = self._classify(text)
         index = 0
         while index < len(text):
-            end_index, info = self._run_from(text, index, greedy=True)
+            end_index, info = self._run_from(cbuf, index, greedy=True)
 
             kind = None
             for gid, intervals in info.items():
@@ -293,44 +692,276 @@ class DFA:
             break
 
 
-class DFAState:
-    _empty = None
-    _instances = {}
+# Source for the capture-free scan kernels. specialize() fills in the dead
+# state number and the set of accepting states as constants, so the hot
+# loop does one table lookup and two constant comparisons per byte:
+#
+#   - scan(buf, offset, greedy) runs the DFA from state 0 over buf[offset:]
+#     and returns the end of the match (the latest nullable index), or None
+#     if nothing past `offset` matched.
+#
+#   - scan_all(buf, haystack, needle, greedy) finds every non-overlapping
+#     match and returns a list of (start, end) spans. Candidate starts are
+#     positions of `needle` in `haystack`, as for DFA._candidates(). After a
+#     match the scan resumes at its end, otherwise at the next candidate.
+#
+#   - record(buf, offset, greedy, trail) is scan() for DFAs with captures.
+#     It runs on the packed steps table and appends the index and event id
+#     of each step whose transition carries events to `trail`, rather than
+#     tracking groups as it goes: such steps are sparse, a failed attempt
+#     never touches a GroupInfo, and a match needs no second pass. Returns
+#     (end_index, end_state, end_len), end_index None if nothing matched.
+#     trail[:end_len] is what was recorded up to the match end; anything
+#     after it belongs to a longer match that failed, and is left out when
+#     DFA._replay() turns the trail into groups.
+#
+#   - record_all(buf, haystack, needle, greedy) is scan_all() for record().
+#     All matches share one trail, cut back to each match's end_len, and it
+#     returns (matches, trail) with (start, end_index, end_state, lo, hi)
+#     per match, trail[lo:hi] being that match's part.
+#
+# A run state loops on every byte class but one, as in [^"]* or .* up to a
+# newline. If the DFA has any, the loop also breaks out on them and hands the
+# rest of the run to bytes.find() for the exit class in `runs`. Without run
+# states that check isn't emitted and the for loop is the whole scan.
+#
+# `buf` is the input translated to byte classes (see DFA._classify()), so
+# indexing it gives the table column directly.
+#
+# Only the constants are specialized, not the transitions. Emitting each
+# state as an if/elif on the class, even for DFAs of a handful of states,
+# measured about twice as slow as the two subscripts of the table lookup:
+# the interpreter pays per branch taken, where compiled code would not.
+#
+_KERNEL_SOURCE = """
+def make(trans, runs, steps):
+    def scan(buf, offset, greedy):
+        n = len(buf)
+        state = 0
+        last_index = None
+        i = offset
+
+        while i < n:
+            for i in range(i, n):
+                state = trans[state][buf[i]]
+
+                if state == {dead}:
+                    return last_index
+
+                if {accept}:
+                    last_index = i + 1
+                    if not greedy:
+                        return last_index
+{run_check}
+            else:
+                return last_index
+
+            i = buf.find(runs[state], i + 1)
+            if i < 0:
+                i = n
+
+            if {accept}:
+                last_index = i
+
+        return last_index
+
+    def scan_all(buf, haystack, needle, greedy):
+        spans = []
+        offset = haystack.find(needle)
+
+        while offset >= 0:
+            last_index = scan(buf, offset, greedy)
+
+            if last_index is None:
+                offset = haystack.find(needle, offset + 1)
+            else:
+                spans.append((offset, last_index))
+                offset = haystack.find(needle, last_index)
+
+        return spans
+
+    def record(buf, offset, greedy, trail):
+        last_index = None
+        last_state = None
+        last_len = 0
+        state = 0
+
+        for i in range(offset, len(buf)):
+            state = steps[state][buf[i]]
+
+            if state > {state_mask}:
+                if state == {dead_step}:
+                    break
+
+                act = state >> {act_shift}
+                state &= {state_mask}
+
+                if act >> {event_shift}:
+                    trail.append(i)
+                    trail.append(act >> {event_shift})
+
+                if act & {act_accept}:
+                    last_index = i + 1
+                    last_state = state
+                    last_len = len(trail)
+                    if not greedy:
+                        break
+
+        return last_index, last_state, last_len
 
-    def __new__(cls, expr):
-        if expr in cls._instances:
-            return cls._instances[expr]
+    def record_all(buf, haystack, needle, greedy):
+        matches = []
+        trail = []
+        offset = haystack.find(needle)
 
-        self = object.__new__(cls)
-        cls._instances[expr] = self
+        while offset >= 0:
+            mark = len(trail)
+            last_index, last_state, last_len = record(buf, offset, greedy, trail)
 
+            if last_index is None:
+                del trail[mark:]
+                offset = haystack.find(needle, offset + 1)
+            else:
+                del trail[last_len:]
+                matches.append((offset, last_index, last_state, mark, last_len))
+                offset = haystack.find(needle, last_index)
+
+        return matches, trail
+
+    return scan, scan_all, record, record_all
+"""
+
+_RUN_CHECK_SOURCE = """
+                if {runs}:
+                    break
+"""
+
+
+def _member(states):
+    """ Source for the cheapest test of `state` against a set of states """
+    if not states:
+        return 'False'
+    if len(states) == 1:
+        return f'state == {next(iter(states))}'
+    return f'state in {set(states)!r}'
+
+
+def specialize(trans, accept, dead, actions):
+    """
+    Generate the scan kernels for one DFA's flat tables (see DFA._flatten())
+    and return them as (scan, scan_all, record, record_all).
+
+    The transition table is bound through a closure rather than written out
+    as a literal, which would make large DFAs slow to compile for no gain in
+    the loop itself.
+    """
+    accepting = {state for state, flag in enumerate(accept) if flag}
+
+    # For record(), each next state with its action packed above it, so
+    # that a plain step is one lookup and one comparison. Every step into
+    # the dead state packs to the same value, checked for first
+    #
+    dead_step = ACT_DEAD << STEP_ACT_SHIFT
+    steps = tuple(
+        tuple(dead_step if act & ACT_DEAD else act << STEP_ACT_SHIFT | target
+              for target, act in zip(row, acts))
+        for row, acts in zip(trans, actions)
+    )
+
+    runs = {}
+    for state, row in enumerate(trans):
+        exits = [code for code, target in enumerate(row) if target != state]
+        if len(exits) == 1 and not dead[state]:
+            runs[state] = bytes(exits)
+
+    source = _KERNEL_SOURCE.format(
+        dead=dead.find(1),
+        accept=_member(accepting),
+        run_check=_RUN_CHECK_SOURCE.format(runs=_member(runs)) if runs else '',
+        dead_step=dead_step,
+        act_accept=ACT_ACCEPT,
+        event_shift=ACT_EVENT_SHIFT,
+        act_shift=STEP_ACT_SHIFT,
+        state_mask=(1 << STEP_ACT_SHIFT) - 1,
+    )
+
+    return _kernel_maker(source)(trans, runs, steps)
+
+
+@functools.lru_cache(maxsize=256)
+def _kernel_maker(source):
+    """
+    The make() defined by one kernel source. The source only depends on a
+    few constants, which small DFAs often have in common, and compiling it
+    is most of what specialize() costs, so each is only compiled once.
+    """
+    namespace = {}
+    exec(source, namespace)
+    return namespace['make']
+
+
+class DFAState:
+    __slots__ = (
+        'regex', 'name', 'isempty', 'isnullable', 'prefix_events', 'prefix_closes',
+        'cls', 'gotos', 'goto_ranges', 'bounds',
+    )
+
+    def __init__(self, expr):
         self.regex = expr
         self.name = None
-        self.prefix_events = None
-        self.goto = [Goto(DFAState.empty(), None)] * 256
 
-        return self
-
-    @classmethod
-    def empty(cls):
-        if cls._empty is None:
-            cls._empty = object.__new__(cls)
-            cls._empty.regex = regex.RegexEmpty()
-            cls._empty.name = None
-            cls._empty.prefix_events = None
-            cls._empty.goto = [Goto(cls._empty)] * 256
-            cls._instances[cls._empty.regex] = cls._empty
+        # Plain copies of the regex properties the scan loops test per step
+        #
+        self.isempty = expr.isempty
+        self.isnullable = expr.isnullable()
+        self.prefix_events = None
+        self.prefix_closes = ()
+        self.cls = bytes(256)
+        self.gotos = ()
 
-        return cls._empty
+        # (lo, hi, goto) per byte range once DFA._compact() drops cls, with
+        # the lo values in bounds
+        #
+        self.goto_ranges = ()
+        self.bounds = ()
 
     __hash__ = object.__hash__
 
     def __eq__(self, other):
         return self is other
 
+    def goto(self, code):
+        """ The Goto taken on byte `code` """
+        return self.goto_ranges[bisect.bisect_right(self.bounds, code) - 1][2]
+
     def __repr__(self):
         return f'DFAState(name={self.name} regex={self.regex})'
 
+def _bytes(text):
+    """
+    The DFA runs on bytes. A str is encoded once as latin-1, so each
+    character up to U+00FF is the byte of the same value; bytes-like input
+    is used as is. Anything else is a TypeError, rather than whatever
+    bytes() would make of it: bytes(5) is five NULs.
+    """
+    if isinstance(text, str):
+        return text.encode('latin-1')
+    if isinstance(text, bytes):
+        return text
+    try:
+        return memoryview(text).tobytes()
+    except TypeError:
+        raise TypeError(f'expected str or a bytes-like object, not {type(text).__name__}') from None
+
+def group_ids(events, kind):
+    """ Sorted group ids of the `kind` (OPEN/CLOSE) events """
+    return tuple(sorted(e.gid for e in events if e.kind == kind))
+
+# Regex nodes are hash-consed, so the same expression is the same object
+# whichever pattern string it was parsed from, and its identity hash is a
+# structural key. DFAs are never modified by matching and can be shared.
+#
+@functools.lru_cache(maxsize=256)
 def compile(expr):
     ''' Construct a DFA from a regular expression '''
 
@@ -340,56 +971,69 @@ def compile(expr):
 class GroupInfo:
     """
     Tracks capture groups based on the set of active groups from each DFA step.
+
+    Group ids are small dense integers, so state is kept in lists indexed by
+    gid, sized by the DFA's num_groups (highest gid + 1; 0 is the whole match).
+    Names of named groups come from the DFA up front.
     """
-    def __init__(self):
-        self.active = {}   # g -> start_index
-        self.final  = {}   # g -> [(start, end), ...]
-        self.names  = {}   # g -> name (str)
+    __slots__ = ('active', 'final', 'names')
+
+    def __init__(self, num_groups: int = 1, names: dict = None):
+        self.active = [-1] * num_groups                 # g -> start_index, -1 if not open
+        self.final  = [[] for _ in range(num_groups)]   # g -> [(start, end), ...]
+        self.names  = names or {}                       # g -> name (str)
 
-    def step(self, index: int, events: set[Event]):
+    def step(self, index: int, opens: tuple[int], closes: tuple[int]):
         """
-        index  = current character index in the input (same `index` you log in DFAStep)
-        events = set of Event(...) from the transition (goto.events)
+        index  = current character index in the input (same `index` run() yields)
+        opens  = gids of OPEN events from the transition (goto._opens)
+        closes = gids of CLOSE events from the transition (goto._closes)
         """
-        if not events:
-            return
-
-        closes = [e for e in events if e.kind == event.CLOSE]
-        opens  = [e for e in events if e.kind == event.OPEN]
+        active = self.active
 
         # Handle close events first
         #
-        for e in closes:
-            gid = e.gid
-            if gid in self.active:
-                start = self.active[gid]
-                self.final.setdefault(gid, []).append((start, index))
-                del self.active[gid]
-
-        for e in opens:
-            # Named groups
-            #
-            if e.name:
-                self.names[e.gid] = e.name
-
-            gid = e.gid
-            # If you can get nested or repeated OPEN without CLOSE, decide policy.
-            # For now: overwrite start (or ignore if already open).
-            #
-            self.active[gid] = index
+        for gid in closes:
+            start = active[gid]
+            if start >= 0:
+                self.final[gid].append((start, index))
+                active[gid] = -1
+
+        # If you can get nested or repeated OPEN without CLOSE, decide policy.
+        # For now: overwrite start (or ignore if already open).
+        #
+        for gid in opens:
+            active[gid] = index
 
 
     def finalize(self, match_start: int, match_end: int):
-        out = {g: list(v) for g, v in self.final.items()}
+        self.end_match(match_start, match_end)
+        return self.groups()
 
-        # Close any still-active groups at end of match
-        #
-        for gid, start in self.active.items():
-            out.setdefault(gid, []).append((start, match_end))
+
+    def end_match(self, match_start: int, match_end: int):
+        """
+        Finish one match: close any still-active groups at match_end and
+        record the whole match as group 0. Spans of further matches
+        accumulate after it.
+        """
+        active = self.active
+        for gid, start in enumerate(active):
+            if start >= 0:
+                self.final[gid].append((start, match_end))
+                active[gid] = -1
 
         # Whole match
         #
-        out.setdefault(0, []).append((match_start, match_end))
+        self.final[0].append((match_start, match_end))
+
+
+    def groups(self):
+        """
+        Return {group_id: [(start, end), ...]} for every match ended so far,
+        with named groups also listed under their name.
+        """
+        out = {gid: spans for gid, spans in enumerate(self.final) if spans}
 
         # Add named groups
         #
@@ -4,10 +4,26 @@ CLOSE = 2
 names = [None, 'OPEN', 'CLOSE']
 
 class Event:
-    def __init__(self, kind: int, gid: int, name: str = None):
-        self.kind = kind # OPEN, CLOSE
-        self.gid = gid
-        self.name = name
+    """
+    A capture group boundary. Events are interned on (kind, gid, name), so
+    there is one instance per distinct event and equality is identity,
+    like Regex nodes. The name is part of the key: otherwise the markers of
+    (?P<x>a) and (?P<y>a) would be hash-consed together and share a name.
+    """
+    __slots__ = ('kind', 'gid', 'name')
+
+    _instance = {}
+
+    def __new__(cls, kind: int, gid: int, name: str = None):
+        key = (kind, gid, name)
+        try:
+            return Event._instance[key]
+        except KeyError:
+            self = object.__new__(cls)
+            self.kind = kind # OPEN, CLOSE
+            self.gid = gid
+            self.name = name
+            return Event._instance.setdefault(key, self)
 
     def __str__(self):
         return self.__repr__()
@@ -15,8 +31,7 @@ class Event:
     def __repr__(self):
         return f"Event({names[self.kind]} {self.gid}{'' if not self.name else ' ' + self.name})"
 
-    def __eq__(self, other):
-        return self.kind == other.kind and self.gid == other.gid
+    __hash__ = object.__hash__
 
-    def __hash__(self):
-        return hash((self.kind, self.gid))
\ No newline at end of file
+    def __eq__(self, other):
+        return self is other
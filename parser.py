@@ -1,38 +1,155 @@
 from .ply import yacc as yacc
-from .ply import lex as lex
+from .ply.lex import LexToken
 from . import regex
 
 from . import event
 
+import copy
+import functools
 import logging
+import re
 LOG = logging.getLogger(__file__)
 
+# Regex nodes are hash-consed, so this is the one epsilon; keeping it here
+# saves the interning lookup on every use
+#
+_EPSILON = regex.RegexEpsilon()
+
+def _span(first, last):
+    """ Character mask of the range first..last """
+    return ((1 << (ord(last) - ord(first) + 1)) - 1) << ord(first)
+
+# Where _lex_class is in a character class, for how '^', '-' and ']' read
+#
+_CLASS_START, _CLASS_CARET, _CLASS_BODY = range(3)
+
+# Characters that are a token by themselves, by token type. Any character
+# not here and without a handler in Parser._HANDLERS is an ID.
+#
+_SINGLE = {
+    '^': 'CARET',
+    '-': 'MINUS',
+    '&': 'AND',
+    '|': 'OR',
+    '?': 'QMARK',
+    '.': 'DOT',
+    '~': 'NOT',
+    '*': 'STAR',
+    '+': 'PLUS',
+    'ε': 'EPSILON',
+}
+
+# Escapes that are tokens of their own; any other escaped character is
+# ESCAPED
+#
+_ESCAPE_TOKENS = {
+    '\\d': 'DIGIT',
+    '\\D': 'NOTDIGIT',
+    '\\s': 'SPACE',
+    '\\S': 'NOTSPACE',
+    '\\w': 'WORD',
+    '\\W': 'NOTWORD',
+}
+
+_IGNORE = frozenset(' \t\r\v\f')
+
+_LPAREN_NAMED = re.compile(r'''
+    \( \s*                     # '('
+      \? \s*                   # '?'
+      P? \s*                   # Optional 'P'
+      < \s*                    # '<'
+        (?P<name>
+          [a-zA-Z_]            # ID
+          [a-zA-Z0-9_]*        # ...
+        ) \s*
+      > \s*                    # '>'
+''', re.VERBOSE)
+
+_LPAREN_NOCAPTURE = re.compile(r'\(\s*\?\s*:')
+
+_INTEGER = re.compile(r'\d+')
+
 class TokenValue:
-    def __init__(self, token, **kwds):
-        self.value = token.value
-        self.kwds = kwds
-        
-        if token.lexer.events:
-            self.kwds['events'] = tuple(token.lexer.events)
+    """
+    Value of a parenthesis token: its text, and the capture events (see
+    event.Event) it opens or closes. Parentheses are the only tokens that
+    generate events; every other token's value is just its text (or, for
+    CLASS, the finished RegexSym).
+    """
+    __slots__ = ('value', 'events')
+
+    def __init__(self, value, events=()):
+        self.value = value
+        self.events = events
+
+        if events:
             LOG.debug(self)
-            token.lexer.events = []
 
     def __repr__(self):
-        return f'TokenValue({self.value!r}, {self.kwds!r})'
+        return f'TokenValue({self.value!r}, {self.events!r})'
 
 
 class Parser:
+    # The LRParser yacc built for the first Parser without options. The
+    # grammar never changes, so yacc only runs once; later Parsers copy it
+    # and bind the rules to their own methods. Copying, rather than building
+    # an LRParser from the tables, stays off PLY's table classes.
+    #
+    _template = None
+
     def __init__(self, **kwargs):
-        self.lexer = lex.lex(module=self, **kwargs)
-        self.parser = yacc.yacc(module=self, **kwargs)
-        self.lexer.groups = [0]
-        self.lexer.events = []
-        self.lexer.line_start = 0
-        self.lexer.group_count = 1
+        self.parser = self._make_parser(**kwargs)
+        self.errors = 0
+
+    def parse(self, data, **kwargs):
+        '''
+        Parse the pattern `data` into a Regex, or None if it has errors.
+        Keyword arguments go to PLY's parse(), except `lexer` and
+        `tokenfunc`: the Parser lexes the pattern itself, so passing either
+        is a TypeError.
+        '''
+        for name in ('lexer', 'tokenfunc'):
+            if name in kwargs:
+                raise TypeError(f"Parser.parse() does its own lexing and takes no '{name}' argument")
+
+        # Every parse starts afresh, so a Parser can be reused for any
+        # number of patterns (though by one thread at a time: yacc keeps
+        # its stacks on the LRParser)
+        #
         self.errors = 0
 
-    def parse(self, *args, **kwargs):
-        return self.parser.parse(*args, **kwargs)
+        # The pattern is lexed up front and yacc fed from the list, so the
+        # parser's per-token call is a plain next() rather than a trip
+        # through the lexer. Nothing in the grammar feeds back into the
+        # lexer, so the tokens are the same either way.
+        #
+        tokens = self.tokenize(data)
+
+        # PLY wants a lexer to hang on the productions even when it is fed
+        # tokens; the Parser is its own
+        #
+        return self.parser.parse(
+            lexer=self, tokenfunc=functools.partial(next, iter(tokens), None), **kwargs
+        )
+
+    def _make_parser(self, **kwargs):
+        if kwargs or Parser._template is None:
+            parser = yacc.yacc(module=self, **kwargs)
+            if not kwargs:
+                Parser._template = parser
+            return parser
+
+        # The action and goto tables are shared, read only; the productions
+        # and error function are the only parts bound to a Parser
+        #
+        parser = copy.copy(Parser._template)
+        parser.productions = [copy.copy(prod) for prod in parser.productions]
+        for prod in parser.productions:
+            if prod.func:
+                prod.callable = getattr(self, prod.func)
+        parser.errorfunc = self.p_error
+
+        return parser
 
 
     tokens = (
@@ -44,8 +161,7 @@ class Parser:
         'LPAREN_NAMED',
         'LPAREN_NOCAPTURE',
         'RPAREN',
-        'LSQUARE',
-        'RSQUARE',
+        'CLASS',
         'LCURLY',
         'RCURLY',
         'COMMA',
@@ -66,239 +182,230 @@ class Parser:
         'ID'
     )
 
-    t_ignore = ' \t\r\v\f'
-
-    def column(self, t):
-        return t.lexpos - t.lexer.line_start
-
-    def t_error(self, t):
-        LOG.error(f'{t.lineno}:{self.column(t)}: Invalid character {repr(t.value[0])}')
-        t.lexer.skip(1)
-
-    states = (
-        ('repeat', 'exclusive'),
-        ('class', 'exclusive')
-    )
-
-    def t_comment(self, t):
-        r'\#[^\n]*'
-        pass
-
-    def t_newline(self, t):
-        r'\n+'
-        t.lexer.lineno += len(t.value)
-        t.lexer.line_start = t.lexpos
-
-    def t_EPSILON(self, t):
-        r'ε'
-        t.value = TokenValue(t)
-        return t
-
-    def t_DIGIT(self, t):
-        r'\\d'
-        t.value = TokenValue(t)
-        return t
-
-    def t_NOTDIGIT(self, t):
-        r'\\D'
-        t.value = TokenValue(t)
-        return t
-
-    def t_SPACE(self, t):
-        r'\\s'
-        t.value = TokenValue(t)
-        return t
-
-    def t_NOTSPACE(self, t):
-        r'\\S'
-        t.value = TokenValue(t)
-        return t
-
-    def t_WORD(self, t):
-        r'\\w'
-        t.value = TokenValue(t)
-        return t
-
-    def t_NOTWORD(self, t):
-        r'\\W'
-        t.value = TokenValue(t)
-        return t    
-
-    def t_CARET(self, t):
-        r'\^'
-        t.value = TokenValue(t)
-        return t
-
-    def t_MINUS(self, t):
-        r'\-'
-        t.value = TokenValue(t)
-        return t
-
-    def t_AND(self, t):
-        r'\&'
-        t.value = TokenValue(t)
-        return t
-
-    def t_OR(self, t):
-        r'\|'
-        t.value = TokenValue(t)
-        return t
-
-    def t_QMARK(self, t):
-        r'\?'
-        t.value = TokenValue(t)
-        return t
-
-    def t_DOT(self, t):
-        r'\.'
-        t.value = TokenValue(t)
-        return t
-
-    def t_NOT(self, t):
-        r'\~'
-        t.value = TokenValue(t)
-        return t
-
-    def t_STAR(self, t):
-        r'\*'
-        t.value = TokenValue(t)
-        return t
-
-    def t_PLUS(self, t):
-        r'\+'
-        t.value = TokenValue(t)
-        return t
-
-    def t_LPAREN_NAMED(self, t):
-        r'''(?x:                    # re.X
-              \( \s*                # '('
-                \? \s*              # '?'
-                P? \s*              # Optional 'P'
-                < \s*               # '<'
-                  (?P<name>
-                    [a-zA-Z_]       # ID
-                    [a-zA-Z0-9_]*   # ...
-                  ) \s*             
-                > \s*               # '>'
-              )
-        '''
-        self.lexer.events.append(event.Event(event.OPEN, self.lexer.group_count,
-            t.lexer.lexmatch.group('name')))
-        t.value = TokenValue(t)
-        self.lexer.groups.append(self.lexer.group_count)
-        self.lexer.group_count += 1
-        return t
-
-    def t_LPAREN_NOCAPTURE(self, t):
-        r'\(\s*\?\s*:'
-        t.value = TokenValue(t)
-        self.lexer.groups.append(-1)
-        return t
-
-    def t_LPAREN(self, t):
-        r'\('
-        self.lexer.events.append(event.Event(event.OPEN, self.lexer.group_count))
-        t.value = TokenValue(t)
-        self.lexer.groups.append(self.lexer.group_count)
-        self.lexer.group_count += 1
-        return t
-
-    def t_RPAREN(self, t):
-        r'\)'
-        group = self.lexer.groups.pop()
-        if group != -1:
-            self.lexer.events.append(event.Event(event.CLOSE, group))
-        t.value = TokenValue(t)
-        return t
-
-    def t_LCURLY(self, t):
-        r'\{'
-        t.lexer.begin('repeat')
-        return t
-
-    def t_ESCAPED(self, t):
-        r'\\.'
-        t.value = TokenValue(t)
-        return t
+    def tokenize(self, data):
+        """ The list of tokens of data """
 
-    t_repeat_ignore = ' \t'
+        # Almost every token is one character, so rather than a master
+        # regex the lexer dispatches on the character at hand: those with
+        # a handler in _HANDLERS lex whatever starts there, the rest are
+        # a token of their own.
+        #
+        self.data = data
+        self.lineno = 1
+        self.groups = [0]
+        self.group_count = 1
+        tokens = []
+        pos = 0
+        while pos < len(data):
+            ch = data[pos]
+            if ch in _IGNORE:
+                pos += 1
+                continue
+
+            handler = Parser._HANDLERS.get(ch)
+            if handler is None:
+                tokens.append(self._token(_SINGLE.get(ch, 'ID'), ch, pos))
+                pos += 1
+            else:
+                pos = handler(self, data, pos, tokens)
 
-    def t_repeat_INTEGER(self, t):
-        r'\d+'
-        t.value = int(t.value)
-        return t
+        return tokens
 
-    def t_repeat_COMMA(self, t):
-        r'\,'
+    def _token(self, type, value, pos):
+        t = LexToken()
+        t.type = type
+        t.value = value
+        t.lineno = self.lineno
+        t.lexpos = pos
         return t
 
-    def t_repeat_RCURLY(self, t):
-        r'\}'
-        t.lexer.begin('INITIAL')
-        return t
+    def column(self, t):
+        return t.lexpos - self.data.rfind('\n', 0, t.lexpos) - 1
+
+    # Each handler lexes what starts at data[pos], appending any tokens,
+    # and returns the position after it
+    #
+    def _lex_comment(self, data, pos, tokens):
+        end = data.find('\n', pos)
+        return len(data) if end < 0 else end
+
+    def _lex_newline(self, data, pos, tokens):
+        end = pos
+        while end < len(data) and data[end] == '\n':
+            end += 1
+        self.lineno += end - pos
+        return end
+
+    def _lex_escape(self, data, pos, tokens):
+        # A trailing '\', or one before a newline, is just itself
+        #
+        if pos + 1 == len(data) or data[pos + 1] == '\n':
+            tokens.append(self._token('ID', '\\', pos))
+            return pos + 1
+
+        value = data[pos:pos + 2]
+        tokens.append(self._token(_ESCAPE_TOKENS.get(value, 'ESCAPED'), value, pos))
+        return pos + 2
+
+    def _lex_lparen(self, data, pos, tokens):
+        m = _LPAREN_NAMED.match(data, pos)
+        if m:
+            events = (event.Event(event.OPEN, self.group_count, m.group('name')),)
+            tokens.append(self._token('LPAREN_NAMED', TokenValue(m.group(), events), pos))
+            self.groups.append(self.group_count)
+            self.group_count += 1
+            return m.end()
+
+        m = _LPAREN_NOCAPTURE.match(data, pos)
+        if m:
+            tokens.append(self._token('LPAREN_NOCAPTURE', m.group(), pos))
+            self.groups.append(-1)
+            return m.end()
+
+        events = (event.Event(event.OPEN, self.group_count),)
+        tokens.append(self._token('LPAREN', TokenValue('(', events), pos))
+        self.groups.append(self.group_count)
+        self.group_count += 1
+        return pos + 1
+
+    def _lex_rparen(self, data, pos, tokens):
+        # An unbalanced ')' is left for the grammar to report
+        #
+        group = self.groups.pop() if self.groups else -1
+        events = (event.Event(event.CLOSE, group),) if group != -1 else ()
+        tokens.append(self._token('RPAREN', TokenValue(')', events), pos))
+        return pos + 1
+
+    def _lex_repeat(self, data, pos, tokens):
+        # The {m,n} of a repeat, where only integers, commas, spaces and
+        # tabs may appear before the '}'
+        #
+        tokens.append(self._token('LCURLY', '{', pos))
+        pos += 1
+        while pos < len(data):
+            ch = data[pos]
+            if ch in ' \t':
+                pos += 1
+            elif ch == ',':
+                tokens.append(self._token('COMMA', ch, pos))
+                pos += 1
+            elif ch == '}':
+                tokens.append(self._token('RCURLY', ch, pos))
+                return pos + 1
+            else:
+                m = _INTEGER.match(data, pos)
+                if m:
+                    tokens.append(self._token('INTEGER', int(m.group()), pos))
+                    pos = m.end()
+                else:
+                    LOG.error("Illegal character '%s' in repeat at %d", ch, pos)
+                    pos += 1
+
+        return pos
+
+    def _lex_class(self, data, pos, tokens):
+        t = self._token('CLASS', None, pos)
+        tokens.append(t)
+        pos += 1
+
+        # The class body is scanned here in one pass rather than a token
+        # per character. `where` tracks how '^', '-' and ']' read:
+        # _CLASS_START before any character, _CLASS_CARET right after a
+        # leading '^', _CLASS_BODY after that.
+        #
+        #   - '^' at the start negates the class, otherwise it's literal
+        #   - ']' at the start (or right after that '^') is literal,
+        #     otherwise it closes the class
+        #   - '-' at the start, after the '^', or last is literal,
+        #     otherwise it makes a range of the characters either side
+        #
+        # Spaces and tabs are ignored, as in the rest of the pattern. In
+        # `items` a range '-' is None, every other entry a literal character.
+        #
+        where = _CLASS_START
+        negate = False
+        items = []
+        closed = False
+        while pos < len(data):
+            ch = data[pos]
+            pos += 1
+
+            if ch in ' \t':
+                continue
+
+            if ch == '\n':
+                LOG.error("Illegal character '%s' in class at %d", ch, pos - 1)
+                continue
+
+            if ch == '^' and where == _CLASS_START:
+                negate = True
+                where = _CLASS_CARET
+                continue
+
+            if ch == '-':
+                if where != _CLASS_BODY or data[pos:pos + 1] == ']':
+                    items.append(ch)
+                else:
+                    items.append(None)
+            elif ch == ']' and where == _CLASS_BODY:
+                closed = True
+                break
+            else:
+                items.append(ch)
 
-    def t_repeat_error(self, t):
-        LOG.error("Illegal character '%s' in repeat at %d", t.value[0], t.lexpos)
-        t.lexer.skip(1)
+            where = _CLASS_BODY
 
-    def t_LSQUARE(self, t):
-        r'\['
-        t.lexer.begin('class')
-        self.ID_scan = []
-        return t
+        if not closed:
+            self._class_error(t, None)
+        elif not items:
+            self._class_error(t, ']')
 
-    t_class_ignore = ' \t'
-
-    def t_class_error(self, t):
-        LOG.error("Illegal character '%s' in class at %d", t.value[0], t.lexpos)
-        t.lexer.skip(1)
-
-    def t_class_MINUS(self, t):
-        r'-'
-    
-        # Position in scanned class so far
-        pos = len(self.ID_scan)
-    
-        # If '-' is first character (or after '^'), it's literal
-        if pos == 0 or (pos == 1 and self.ID_scan[0] == '^'):
-            t.type = 'ID'
-        else:
-            # Peek next character to see if we're right before ']'
-            nxt = t.lexer.lexdata[t.lexer.lexpos:t.lexer.lexpos+1]
-    
-            if nxt == ']':
-                # '-' at end of class is literal
-                t.type = 'ID'
+        # items is a sequence of single characters and (start, None, end)
+        # ranges; anything else is the syntax error the grammar would
+        # have reported
+        #
+        mask = 0
+        i = 0
+        while i < len(items):
+            start = items[i]
+            if start is None:
+                self._class_error(t, '-')
+                break
+
+            if i + 1 < len(items) and items[i + 1] is None:
+                end = items[i + 2] if i + 2 < len(items) else None
+                if end is None:
+                    self._class_error(t, '-' if i + 2 < len(items) else ']')
+                    break
+                if start <= end:
+                    mask |= _span(start, end)
+                else:
+                    LOG.error('Error: Range %s-%s in non-increasing order', start, end)
+                    self.errors += 1
+                i += 3
             else:
-                # Otherwise it's a range operator
-                t.type = 'MINUS'
-    
-        self.ID_scan.append(t.value)
-        t.value = TokenValue(t)
-        return t
+                mask |= 1 << ord(start)
+                i += 1
 
-    def t_class_ID(self, t):
-        r'.'
-    
-        self.ID_scan.append(t.value)
-    
-        if t.value == '^' and len(self.ID_scan) == 1:
-            t.type = 'CARET'
-    
-        if t.value == ']':
-            if self.ID_scan == [']'] or self.ID_scan == ['^', ']']:
-                pass
-            else:
-                t.lexer.begin('INITIAL')
-                t.type = 'RSQUARE'
-    
-        t.value = TokenValue(t)
-        return t
+        t.value = regex.RegexSym(mask, negate=negate)
+        return pos
 
-    def t_ID(self, t):
-        r'.'
-        t.value = TokenValue(t)
-        return t
+    def _class_error(self, t, at):
+        self.errors += 1
+        if at is None:
+            LOG.error('%d:%d: Syntax error at end of input in class', t.lineno, self.column(t))
+        else:
+            LOG.error('%d:%d: Syntax error at "%s" in class', t.lineno, self.column(t), at)
+
+    _HANDLERS = {
+        '#': _lex_comment,
+        '\n': _lex_newline,
+        '\\': _lex_escape,
+        '(': _lex_lparen,
+        ')': _lex_rparen,
+        '{': _lex_repeat,
+        '[': _lex_class,
+    }
 
     precedence = (
         ('left', 'OR', 'CARET', 'MINUS'),
@@ -309,19 +416,19 @@ class Parser:
 
     def p_expr_and(self, p):
         'expression : expression AND expression'
-        p[0] = regex.RegexAnd(p[1], p[3], **p[2].kwds)
+        p[0] = regex.RegexAnd(p[1], p[3])
 
     def p_expr_or(self, p):
         'expression : expression OR expression'
-        p[0] = regex.RegexOr(p[1], p[3], **p[2].kwds)
+        p[0] = regex.RegexOr(p[1], p[3])
 
     def p_expr_diff(self, p):
         'expression : expression MINUS expression'
-        p[0] = regex.RegexDiff(p[1], p[3], **p[2].kwds)
+        p[0] = regex.RegexDiff(p[1], p[3])
 
     def p_expr_xor(self, p):
         'expression : expression CARET expression'
-        p[0] = regex.RegexXor(p[1], p[3], **p[2].kwds)
+        p[0] = regex.RegexXor(p[1], p[3])
 
     def p_expr_concat(self, p):
         'expression : concat %prec CONCAT'
@@ -337,12 +444,12 @@ class Parser:
 
     def p_primary_not(self, p):
         'primary : NOT primary'
-        p[0] = regex.RegexNot(p[2], **p[1].kwds)
+        p[0] = regex.RegexNot(p[2])
 
 
     def p_primary_star(self, p):
         'primary : primary STAR'
-        p[0] = regex.RegexStar(p[1], **p[2].kwds)
+        p[0] = regex.RegexStar(p[1])
 
     def p_primary_plus(self, p):
         'primary : primary PLUS'
@@ -350,20 +457,38 @@ class Parser:
 
     def p_primary_opt(self, p):
         'primary : primary QMARK'
-        p[0] = regex.RegexOpt(p[1], **p[2].kwds)
+        p[0] = regex.RegexOpt(p[1])
 
     def p_primary_repeat(self, p):
         'primary : primary LCURLY rspec RCURLY'
 
-        # Generate a concatenation of an expression num times
+        # Generate a concatenation of an expression num times. Concatenation
+        # is associative, so the copies are doubled up rather than chained:
+        # O(log num) nodes instead of num.
         #
         def make_cat(expr, num):
-            cat = expr
-            for _ in range(num - 1):
-                cat = regex.RegexConcat(cat, expr)
+            cat = _EPSILON
+            power = expr
+            while num:
+                if num & 1:
+                    cat = regex.RegexConcat(cat, power)
+                num >>= 1
+                if num:
+                    power = regex.RegexConcat(power, power)
 
             return cat
 
+        # r{lo,hi} as r{lo} followed by hi - lo nested optional copies,
+        # r{lo}(r(r...)?)?, which is linear in hi rather than an
+        # alternative per count
+        #
+        def make_alts(expr, lo, hi):
+            tail = _EPSILON
+            for _ in range(lo, hi):
+                tail = regex.RegexOpt(regex.RegexConcat(expr, tail))
+
+            return regex.RegexConcat(make_cat(expr, lo), tail)
+
         if isinstance(p[3], int):
             p[0] = make_cat(p[1], p[3])
 
@@ -372,10 +497,7 @@ class Parser:
         
             # {,n}  →  0..n
             if lo is None and hi is not None:
-                p[0] = regex.RegexEpsilon()
-                for k in range(1, hi + 1):
-                    cat = make_cat(p[1], k)
-                    p[0] = regex.RegexOr(p[0], cat)
+                p[0] = make_alts(p[1], 0, hi)
         
             # {0,}  →  0..∞  ==  r*
             elif lo == 0 and hi is None:
@@ -387,62 +509,44 @@ class Parser:
                 p[0] = regex.RegexConcat(base, regex.RegexStar(p[1]))
         
             # {m,n} with finite bounds
-            else:
-                p[0] = None
-                for k in range(lo, hi + 1):
-                    if k == 0:
-                        cat = regex.RegexEpsilon()
-                    else:
-                        cat = make_cat(p[1], k)
-
-                    if p[0] is None:
-                        p[0] = cat
-                    else:
-                        p[0] = regex.RegexOr(p[0], cat)
-
-    _DIGIT_MASK = 0
-    for code in range(ord('0'), ord('9') + 1):
-        _DIGIT_MASK |= 1 << code
+            elif lo <= hi:
+                p[0] = make_alts(p[1], lo, hi)
+
+    _DIGIT_MASK = _span('0', '9')
 
     def p_primary_digits(self, p):
         'primary : DIGIT'
 
-        p[0] = regex.RegexSym(Parser._DIGIT_MASK, **p[1].kwds)
+        p[0] = regex.RegexSym(Parser._DIGIT_MASK)
 
     def p_primary_notdigit(self, p):
         'primary : NOTDIGIT'
 
-        p[0] = regex.RegexSym(Parser._DIGIT_MASK, negate=True, **p[1].kwds)
+        p[0] = regex.RegexSym(Parser._DIGIT_MASK, negate=True)
 
-    _SPACE_MASK = 0
-    for ch in (' ', '\t', '\n', '\r', '\v', '\f'):
-        _SPACE_MASK |= 1 << ord(ch)
+    # \t \n \v \f \r are contiguous
+    #
+    _SPACE_MASK = _span('\t', '\r') | 1 << ord(' ')
 
-    _WORD_MASK = 0
-    for c in range(ord('A'), ord('Z') + 1):
-        _WORD_MASK |= 1 << c
-    for c in range(ord('a'), ord('z') + 1):
-        _WORD_MASK |= 1 << c
-    _WORD_MASK |= _DIGIT_MASK
-    _WORD_MASK |= 1 << ord('_')
+    _WORD_MASK = _span('A', 'Z') | _span('a', 'z') | _DIGIT_MASK | 1 << ord('_')
 
     def p_primary_word(self, p):
         'primary : WORD'
-        p[0] = regex.RegexSym(Parser._WORD_MASK, **p[1].kwds)
+        p[0] = regex.RegexSym(Parser._WORD_MASK)
 
     def p_primary_notword(self, p):
         'primary : NOTWORD'
-        p[0] = regex.RegexSym(Parser._WORD_MASK, negate=True, **p[1].kwds)
+        p[0] = regex.RegexSym(Parser._WORD_MASK, negate=True)
 
     def p_primary_space(self, p):
         'primary : SPACE'
         
-        p[0] = regex.RegexSym(Parser._SPACE_MASK, **p[1].kwds)
+        p[0] = regex.RegexSym(Parser._SPACE_MASK)
 
     def p_primary_notspace(self, p):
         'primary : NOTSPACE'
 
-        p[0] = regex.RegexSym(Parser._SPACE_MASK, negate=True, **p[1].kwds)
+        p[0] = regex.RegexSym(Parser._SPACE_MASK, negate=True)
 
     def p_primary_id(self, p):
         'primary : literal'
@@ -452,109 +556,59 @@ class Parser:
         'primary : LPAREN expression RPAREN'
 
         expr = regex.RegexExpr(p[2])
-        concat = regex.RegexConcat(regex.RegexMarker(**p[1].kwds), expr)
+        concat = regex.RegexConcat(regex.RegexMarker(p[1].events), expr)
 
-        p[0] = regex.RegexConcat(concat, regex.RegexMarker(**p[3].kwds))
+        p[0] = regex.RegexConcat(concat, regex.RegexMarker(p[3].events))
 
     def p_primary_named_expr(self, p):
         'primary : LPAREN_NAMED expression RPAREN'
 
         expr = regex.RegexExpr(p[2])
-        concat = regex.RegexConcat(regex.RegexMarker(**p[1].kwds), expr)
+        concat = regex.RegexConcat(regex.RegexMarker(p[1].events), expr)
 
-        p[0] = regex.RegexConcat(concat, regex.RegexMarker(**p[3].kwds))
+        p[0] = regex.RegexConcat(concat, regex.RegexMarker(p[3].events))
 
     def p_primary_no_capture_expr(self, p):
         'primary : LPAREN_NOCAPTURE expression RPAREN'
-        p[0] = regex.RegexExpr(p[2], **p[1].kwds)
+        p[0] = regex.RegexExpr(p[2])
 
     def p_primary_class(self, p):
-        'primary : LSQUARE opt_caret ranges RSQUARE'
-        negate = p[2]         # True if there was a '^', else False
-        items  = p[3]         # list of (char, kwds)
-
-        # Build a single bitmask for all characters in this class
-        #
-        mask = 0
-        for ch, _kwds in items:
-            mask |= 1 << ord(ch)
-
-        # Reuse the kwds from the first item (escape flags etc.)
-        #
-        kwds = items[0][1] if items else {}
-
-        # One RegexSym that represents the whole class, possibly negated
-        # 
-        p[0] = regex.RegexSym(mask, negate=negate, **kwds)
-
-    def p_class_inversion(self, p):
-        'opt_caret : CARET'
-        p[0] = True
-
-    def p_class_positive(self, p):
-        'opt_caret : '
-        p[0] = False
-
-    def p_ranges_list(self, p):
-        'ranges : ranges range'
-        p[0] = p[1] + p[2]
-
-    def p_ranges_init(self, p):
-        'ranges : range'
+        'primary : CLASS'
         p[0] = p[1]
 
-    def p_range_literal(self, p):
-        'range : ID'
-        p[0] = [(p[1].value, p[1].kwds)]
-
-    def p_range_span(self, p):
-        'range : ID MINUS ID'
-        p[0] = []
-
-        start = ord(p[1].value)
-        end   = ord(p[3].value)
-
-        if start <= end:
-            for code in range(start, end + 1):
-                p[0].append((chr(code), p[1].kwds))
-        else:
-            LOG.error('Error: Range %s-%s in non-increasing order', p[1].value,
-                p[3].value)
-            self.errors += 1
-
     def p_literal_dot(self, p):
         'literal : DOT'
-        p[0] = regex.RegexDot(**p[1].kwds)
+        p[0] = regex.RegexDot()
 
     def p_literal_id(self, p):
         'literal : ID'
-        p[0] = regex.RegexSym(p[1].value, **p[1].kwds)
+        p[0] = regex.RegexSym(p[1])
 
     def p_literal_minus(self, p):
         'literal : MINUS'
-        p[0] = regex.RegexSym(p[1].value, **p[1].kwds)
+        p[0] = regex.RegexSym(p[1])
+
+    # Escapes standing for control characters; any other escaped character
+    # is itself
+    #
+    _ESCAPES = {
+        '\\a': '\a',
+        '\\b': '\b',
+        '\\t': '\t',
+        '\\n': '\n',
+        '\\v': '\v',
+        '\\f': '\f',
+        '\\r': '\r',
+    }
 
     def p_literal_escaped(self, p):
         'literal : ESCAPED'
 
-        ctrl = {
-            '\\a': '\a',
-            '\\b': '\b',
-            '\\t': '\t',
-            '\\n': '\n',
-            '\\v': '\v',
-            '\\f': '\f',
-            '\\r': '\r',
-        }
-
-        if p[1].value in ctrl:
-            p[0] = regex.RegexSym(ctrl[p[1].value], **p[1].kwds)
-        else:
-            p[0] = regex.RegexSym(p[1].value[1], **p[1].kwds)
+        p[0] = regex.RegexSym(Parser._ESCAPES.get(p[1], p[1][1]))
 
     def p_literal_epsilon(self, p):
         'literal : EPSILON'
-        p[0] = regex.RegexEpsilon()
+        p[0] = _EPSILON
 
     def p_rspec_only(self, p):
         'rspec : INTEGER'
@@ -579,6 +633,7 @@ class Parser:
         self.errors += 1
 
         if (p):
-            LOG.error(f'{p.lineno}:{self.column(p)}: Syntax error at "{p.value.value}"')
+            value = p.value.value if isinstance(p.value, TokenValue) else p.value
+            LOG.error(f'{p.lineno}:{self.column(p)}: Syntax error at "{value}"')
         else:
             LOG.error('Syntax error at end of input')
\ No newline at end of file
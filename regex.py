@@ -17,51 +17,114 @@ CHARSET_MAX = (1 << 256)
 #
 class Regex:
     '''Base class for all regular expression objects'''
+
+    # Nodes are many and small, so they get slots rather than a dict each.
+    # Subclasses add the attributes of their own
+    #
+    __slots__ = ('id', '_derived', '_isnullable', '_repr', '_prefix_markers', 'charset')
+
     _instance = {}
     _id_count = 0
 
+    # Names of the attributes holding a node's sub-expressions, in the
+    # order repr() lists them
+    #
+    _children = ()
+
+    # Defaults, overridden by the classes they don't hold for. isany and
+    # events vary per node where they vary at all, so the classes setting
+    # them in init have a slot for them
+    #
+    events = ()
+
+    isempty = False
+    isepsilon = False
+    ismarker = False
+    isstar = False
+    isplus = False
+    isopt = False
+    isexpr = False
+    isdot = False
+    isany = False
+    isnot = False
+
     @classmethod
     def _intern(cls, key, init):
         """
-        init(self) should set all subclass-specific attributes.
-        This method handles caching + all base defaults exactly once.
-        """
-        try:
-            return Regex._instance[key]
-        except KeyError:
-            self = object.__new__(cls)
-            self.key = key
-
-            self.id = len(Regex._instance)
-
-            self._nullable = None
-            self.events = ()
+        init(self) should set all subclass-specific attributes. This method
+        handles the caching, and the attributes in Regex.__slots__ other
+        than charset.
 
-            self._prefix_markers = None
+        Keys end with the constructor's keyword arguments as a sorted
+        tuple. There almost never are any, and () is far cheaper to build
+        and hash than a frozenset.
+        """
+        instance = Regex._instance
+        self = instance.get(key)
+        if self is not None:
+            return self
 
-            self.isempty = False
-            self.isepsilon = False
-            self.ismarker = False
-            self.isstar = False
-            self.isplus = False
-            self.isopt = False
-            self.isexpr = False
-            self.isdot = False
-            self.isany = False
-            self.isnot = False
+        self = object.__new__(cls)
+        self.id = len(instance)
+        self._derived = {}
+        self._isnullable = False
+        self._repr = None
+        self._prefix_markers = None
 
-            init(self)
+        init(self)
 
-            Regex._instance[key] = self
-            return self
+        # setdefault, so that of two threads interning the same key at
+        # once, both get the node that went in first
+        #
+        return instance.setdefault(key, self)
 
+    # ν(r) is always ε or ∅, so rather than building it as a tree each
+    # node works out which at construction, from its children's
+    #
     def nullable(self):
-        return RegexEmpty()
+        return _EPSILON if self._isnullable else _EMPTY
 
     def isnullable(self):
-        return self.nullable().isepsilon
+        return self._isnullable
 
     def derive(self, ch, states, negate_states=False):
+        '''
+        ∂ch(self), adding the nodes the transition passes through to
+        `states`. Nodes are immutable and hash-consed, so both are the same
+        every time and are kept per (ch, negate_states): a subexpression
+        shared by many DFA states is only derived once per character.
+        Subclasses implement _derive; the leaves, which are cheaper to
+        derive than to look up, override derive itself.
+        '''
+        key = (ch, negate_states)
+        try:
+            result, passed = self._derived[key]
+        except KeyError:
+            passed = set()
+            result = self._derive(ch, passed, negate_states)
+            self._derived[key] = (result, passed)
+
+        if passed:
+            states |= passed
+
+        return result
+
+    def derivation(self, ch, negate_states=False):
+        '''
+        (∂ch(self), the nodes it passes through) as derive() finds them, for
+        callers that only keep the nodes if the derivative isn't ∅: they
+        get the cached set itself, rather than a fresh one to collect into.
+        It is shared, so must not be changed.
+        '''
+        key = (ch, negate_states)
+        try:
+            return self._derived[key]
+        except KeyError:
+            passed = set()
+            derived = self._derived[key] = (self._derive(ch, passed, negate_states), passed)
+            return derived
+
+    def _derive(self, ch, states, negate_states=False):
         raise Exception('derive')
 
     __hash__ = object.__hash__
@@ -80,19 +143,20 @@ class Regex:
         return not self.isempty
 
     def __repr__(self):
-        rep = '<%s %s=0x%x' % (self.__class__.__name__, self.id, id(self))
-        if hasattr(self, 'left'):
-            rep += ' 0x%x' % id(self.left)
-        if hasattr(self, 'right'):
-            rep += ' 0x%x' % id(self.right)
-        if hasattr(self, 'expr'):
-            rep += ' 0x%x' % id(self.expr)
-        if hasattr(self, 'sym'):
-            rep += ' %s' % repr(self.sym)
-        rep += f' events={self.events}'
-        rep += '>'
-
-        return rep
+        # Nodes never change, so neither does this; tree() and debug logging
+        # ask for it over and over
+        #
+        if self._repr is None:
+            rep = '<%s %s=0x%x' % (self.__class__.__name__, self.id, id(self))
+            for name in self._children:
+                rep += ' 0x%x' % id(getattr(self, name))
+            if hasattr(self, 'sym'):
+                rep += ' %s' % repr(self.sym)
+            rep += f' events={self.events}'
+            rep += '>'
+            self._repr = rep
+
+        return self._repr
 
     # Rank precedence values for each tree type
     #
@@ -124,57 +188,58 @@ class Regex:
 
     def tree(self, prefix='', is_last=True):
         ''' Output a representation of an RE as an ASCII tree '''
-        out = ''
-        if prefix:
-            if is_last:
-                out += prefix[:-4] + '└── '
-            else:
-                out += prefix[:-4] + '├── '
-        out += repr(self) + '\n'
-        if hasattr(self, 'right') and hasattr(self, 'left'):
-            out += prefix + '│    \n'
-            out += self.right.tree(prefix=prefix + '│   ', is_last=False)
-            out += prefix + '│    \n'
-            out += self.left.tree(prefix=prefix + '    ', is_last=True)
-        if hasattr(self, 'expr'):
-            out += prefix + '│    \n'
-            out += self.expr.tree(prefix=prefix + '    ', is_last=True)
+        out = []
 
-        return out
+        # Depth first off an explicit stack, as long concatenations nest
+        # deeper than the recursion limit. Entries are nodes to draw or
+        # connector lines to emit as is.
+        #
+        stack = [(self, prefix, is_last)]
+        while stack:
+            entry = stack.pop()
+            if isinstance(entry, str):
+                out.append(entry)
+                continue
+
+            node, prefix, is_last = entry
+            if prefix:
+                out.append(prefix[:-4] + ('└── ' if is_last else '├── '))
+            out.append(repr(node) + '\n')
+
+            # Last child first, so a binary node shows right above left.
+            # Pushed in reverse, to come off the stack in that order
+            #
+            children = node._children
+            for i, name in enumerate(children):
+                is_last = i == 0
+                stack.append((getattr(node, name), prefix + ('    ' if is_last else '│   '), is_last))
+                stack.append(prefix + '│    \n')
+
+        return ''.join(out)
 
-    # Walk an expr and apply a function (code) on each element
+    # Walk an expr and apply a function (code) on each element, parents
+    # before children
     #
     def walk(self, code):
-        # work on this object
-        #
-        code(self)
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            code(node)
 
-        # Walk to the children
-        #
-        if hasattr(self, 'left'):
-            self.left.walk(code)
-        if hasattr(self, 'right'):
-            self.right.walk(code)
-        if hasattr(self, 'expr'):
-            self.expr.walk(code)
+            stack.extend(getattr(node, name) for name in reversed(node._children))
 
 
     @staticmethod
     def get_args(expr, expr_type):
-        ''' Gather all the arguments for an expression reaching down to sub-expressions '''
-        args = []
-
+        '''
+        Gather all the arguments for an expression reaching down to
+        sub-expressions. Nodes of expr_type keep theirs from construction
+        in `args`, so this doesn't walk the tree.
+        '''
         if isinstance(expr, expr_type):
-            if hasattr(expr, 'left'):
-                args += Regex.get_args(expr.left, expr_type)
-            if hasattr(expr, 'right'):
-                args += Regex.get_args(expr.right, expr_type)
-            if hasattr(expr, 'expr'):
-                args += Regex.get_args(expr.expr, expr_type)
-        else:
-            args.append(expr)
+            return expr.args
 
-        return args
+        return (expr,)
 
 
 class RegexEmpty(Regex):
@@ -184,20 +249,24 @@ class RegexEmpty(Regex):
     ν(0) = 0 (False)
 
     '''
+    __slots__ = ()
+    isempty = True
     sym = '∅'
 
     def __new__(cls, **kwargs):
-        key = (cls, frozenset(kwargs.items()))
+        key = (cls, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.charset = CharSet(CHARSET_MAX - 1)
-            self.isempty = True
 
         return cls._intern(key, init)
 
     def derive(self, ch, states, negate_states=False):
         return self
 
+    def derivation(self, ch, negate_states=False):
+        return self, _NOTHING
+
     def __str__(self):
         return RegexEmpty.sym
 
@@ -209,23 +278,26 @@ class RegexEpsilon(Regex):
     ν(ε) = ε (True)
 
     '''
+    __slots__ = ()
+    isepsilon = True
     sym = 'ε'
 
     def __new__(cls, **kwargs):
-        key = (cls, frozenset(kwargs.items()))
+        key = (cls, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.charset = CharSet(CHARSET_MAX - 1)
-            self.isepsilon = True
+            self._isnullable = True
             return self
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        return self
 
     def derive(self, ch, states, negate_states=False):
-        return RegexEmpty()
+        return _EMPTY
+
+    def derivation(self, ch, negate_states=False):
+        return _EMPTY, _NOTHING
 
     def __str__(self):
         return RegexEpsilon.sym
@@ -241,8 +313,21 @@ class RegexSym(Regex):
     If 'negate' is False, this matches any character in the set.
     If 'negate' is True, this matches any character NOT in the set.
     '''
+    __slots__ = ('mask', 'sym', 'negate', '_alone')
+
+    # Nodes for single characters made without options, by code: the
+    # common case, as every literal in a pattern is one, so it skips the
+    # mask and key building below
+    #
+    _chars = [None] * 256
 
     def __new__(cls, sym, negate=False, **kwargs):
+        code = ord(sym) if isinstance(sym, str) and len(sym) == 1 and not negate and not kwargs else 256
+        if code < 256:
+            node = RegexSym._chars[code]
+            if node is not None:
+                return node
+
         full_mask = CHARSET_MAX - 1
 
         if isinstance(sym, int):
@@ -262,27 +347,33 @@ class RegexSym(Regex):
 
         match_mask = (full_mask ^ raw_mask) if negate else raw_mask
 
-        key = (cls, match_mask, frozenset(kwargs.items()))
+        key = (cls, match_mask, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.mask = match_mask
             self.sym = display_sym
             self.negate = negate
             self.charset = CharSet(match_mask, full_mask ^ match_mask)
+            self._alone = frozenset((self,))
 
-        return cls._intern(key, init)
+        node = cls._intern(key, init)
+        if code < 256:
+            RegexSym._chars[code] = node
+
+        return node
 
 
     def derive(self, ch, states, negate_states=False):
-        bit = 1 << ord(ch)
-        match = bool(self.mask & bit)
+        match = self.mask >> ord(ch) & 1
 
         if match != negate_states:
             states.add(self)
 
-        if match:
-            return RegexEpsilon()
-        return RegexEmpty()
+        return _EPSILON if match else _EMPTY
+
+    def derivation(self, ch, negate_states=False):
+        match = self.mask >> ord(ch) & 1
+        return _EPSILON if match else _EMPTY, self._alone if match != negate_states else _NOTHING
 
     def __str__(self):
         return CharSet.fmt_mask(self.mask, bracket=False)
@@ -294,7 +385,9 @@ class RegexOr(Regex):
     ν(r+s) = ν(r) + ν(s)
 
     '''
+    __slots__ = ('left', 'right', 'args')
     sym = '|'
+    _children = ('left', 'right')
 
     def __new__(cls, left, right, **kwargs):
         ''' Create an OR '''
@@ -303,7 +396,7 @@ class RegexOr(Regex):
         #    r + ¬∅ ≈ ¬∅
         #
         if left.isany or right.isany:
-            return RegexNot(RegexEmpty())
+            return RegexNot(_EMPTY)
 
         # 5) ∅ + r ≈ r
         #    r + ∅ ≈ r
@@ -318,8 +411,8 @@ class RegexOr(Regex):
         if left is right:
             return left
 
-        args_l = set(Regex.get_args(left, RegexOr))
-        args_r = set(Regex.get_args(right, RegexOr))
+        args_l = frozenset(Regex.get_args(left, RegexOr))
+        args_r = frozenset(Regex.get_args(right, RegexOr))
         if args_r <= args_l:
             return left
         if args_l <= args_r:
@@ -328,40 +421,45 @@ class RegexOr(Regex):
         # 2) r + s ≈ s + r
         #
         args_u = args_l | args_r
-        key = (cls, frozenset(args_u), frozenset(kwargs.items()))
+        key = (cls, args_u, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.left = left
             self.right = right
+            self.args = args_u
+            self._isnullable = left._isnullable or right._isnullable
             self.charset = self.left.charset & self.right.charset
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        if self._nullable is None:
-            self._nullable = RegexOr(self.left.nullable(), self.right.nullable())
-
-        return self._nullable
 
     def prefix_markers(self):
         if self._prefix_markers is None:
-            self._prefix_markers = self.left.prefix_markers() | self.right.prefix_markers()
+            # Over the flattened args, rather than down the tree of ORs
+            #
+            out = set()
+            for arg in self.args:
+                out |= arg.prefix_markers()
 
-        return self._prefix_markers
+            self._prefix_markers = out
 
-    def derive(self, ch, states, negate_states=False):
-        lstates = set()
-        rstates = set()
+        return self._prefix_markers
 
-        left  = self.left.derive(ch, lstates, negate_states)
-        right = self.right.derive(ch, rstates, negate_states)
+    def _derive(self, ch, states, negate_states=False):
+        # An OR is interned on its flattened args, and the rules above don't
+        # depend on how they're grouped, so the derivative is taken over the
+        # args directly rather than down the tree of binary ORs: the result
+        # is the same node, for one derive per alternative.
+        #
+        result = None
+        for arg in self.args:
+            derived, passed = arg.derivation(ch, negate_states)
 
-        if not left.isempty:
-            states |= lstates
-        if not right.isempty:
-            states |= rstates
+            if not derived.isempty:
+                states |= passed
+                result = derived if result is None else RegexOr(result, derived)
 
-        return RegexOr(left, right)
+        return _EMPTY if result is None else result
 
     def __str__(self):
         return f'{self.paren(self.left)} {RegexOr.sym} {self.paren(self.right)}'
@@ -374,7 +472,9 @@ class RegexXor(Regex):
     ν(r⊕s) = ν(r) ⊕ ν(s)
 
     '''
+    __slots__ = ('left', 'right')
     sym = '^'
+    _children = ('left', 'right')
 
     def __new__(cls, left, right, **kwargs):
         ''' Create an XOR '''
@@ -382,7 +482,7 @@ class RegexXor(Regex):
         # 3) r ⊕ r = ∅
         #
         if left is right:
-            return RegexEmpty()
+            return _EMPTY
 
         # 1) ∅ ⊕ r = r
         #
@@ -394,20 +494,16 @@ class RegexXor(Regex):
         if right.isempty:
             return left
 
-        key = (cls, frozenset((left, right)), frozenset(kwargs.items()))
+        key = (cls, frozenset((left, right)), tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.left = left
             self.right = right
+            self._isnullable = left._isnullable != right._isnullable
             self.charset = self.left.charset & self.right.charset
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        if self._nullable is None:
-            self._nullable = RegexXor(self.left.nullable(), self.right.nullable())
-
-        return self._nullable
 
     def prefix_markers(self):
         if self._prefix_markers is None:
@@ -415,7 +511,7 @@ class RegexXor(Regex):
 
         return self._prefix_markers
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         return RegexXor(self.left.derive(ch, states, negate_states), self.right.derive(ch, states, negate_states))
 
     def __str__(self):
@@ -429,7 +525,9 @@ class RegexAnd(Regex):
     ν(r&s) = ν(r) & ν(s)
 
     '''
+    __slots__ = ('left', 'right', 'args')
     sym = '&'
+    _children = ('left', 'right')
 
     def __new__(cls, left, right, **kwargs):
         ''' Create an AND '''
@@ -437,7 +535,7 @@ class RegexAnd(Regex):
         # 4) ∅ & r ≈ ∅
         #
         if left.isempty or right.isempty:
-            return RegexEmpty()
+            return _EMPTY
 
         # 5) ¬∅ & r ≈ r
         #    r & ¬∅ ≈ r
@@ -451,37 +549,45 @@ class RegexAnd(Regex):
         if left is right:
             return left
 
-        args_l = set(Regex.get_args(left, RegexAnd))
-        args_r = set(Regex.get_args(right, RegexAnd))
+        args_l = frozenset(Regex.get_args(left, RegexAnd))
+        args_r = frozenset(Regex.get_args(right, RegexAnd))
         if args_r <= args_l:
             return left
         if args_l <= args_r:
             return right
 
         args_u = args_l | args_r
-        key = (cls, frozenset(args_u), frozenset(kwargs.items()))
+        key = (cls, args_u, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.left = left
             self.right = right
+            self.args = args_u
+            self._isnullable = left._isnullable and right._isnullable
             self.charset = self.left.charset & self.right.charset
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        if self._nullable is None:
-            self._nullable = RegexAnd(self.left.nullable(), self.right.nullable())
-
-        return self._nullable
 
     def prefix_markers(self):
         if self._prefix_markers is None:
-            self._prefix_markers = self.left.prefix_markers() | self.right.prefix_markers()
+            out = set()
+            for arg in self.args:
+                out |= arg.prefix_markers()
+
+            self._prefix_markers = out
 
         return self._prefix_markers
 
-    def derive(self, ch, states, negate_states=False):
-        return RegexAnd(self.left.derive(ch, states, negate_states), self.right.derive(ch, states, negate_states))
+    def _derive(self, ch, states, negate_states=False):
+        # As for RegexOr, over the flattened args
+        #
+        args = iter(self.args)
+        result = next(args).derive(ch, states, negate_states)
+        for arg in args:
+            result = RegexAnd(result, arg.derive(ch, states, negate_states))
+
+        return result
 
     def __str__(self):
         return f'{self.paren(self.left)} {RegexAnd.sym} {self.paren(self.right)}'
@@ -494,7 +600,10 @@ class RegexStar(Regex):
     ν(r*) = ε (True)
 
     '''
+    __slots__ = ('expr', 'isany')
+    isstar = True
     sym = '*'
+    _children = ('expr',)
 
     def __new__(cls, expr, **kwargs):
         # 1) (r∗)∗ ≈ r∗
@@ -506,20 +615,18 @@ class RegexStar(Regex):
         # 3) ∅∗ ≈ ε
         #
         if expr.isempty:
-            return RegexEpsilon()
+            return _EPSILON
 
-        key = (cls, expr, frozenset(kwargs.items()))
+        key = (cls, expr, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.expr = expr
             self.charset = self.expr.charset
-            self.isstar = True
+            self._isnullable = True
             self.isany = self.expr.isdot
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        return RegexEpsilon()
 
     def prefix_markers(self):
         if self._prefix_markers is None:
@@ -527,7 +634,7 @@ class RegexStar(Regex):
 
         return self._prefix_markers
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         return RegexConcat(self.expr.derive(ch, states, negate_states), self)
 
     def __str__(self):
@@ -541,7 +648,10 @@ class RegexPlus(Regex):
     ν(r+) = ν(r)
 
     '''
+    __slots__ = ('expr',)
+    isplus = True
     sym = '+'
+    _children = ('expr',)
 
     def __new__(cls, expr, **kwargs):
         # 1) (r+)+ ≈ r+
@@ -549,17 +659,15 @@ class RegexPlus(Regex):
         if expr.isplus:
             return expr
 
-        key = (cls, expr, frozenset(kwargs.items()))
+        key = (cls, expr, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.expr = expr
             self.charset = self.expr.charset
-            self.isplus = True
+            self._isnullable = expr._isnullable
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        return self.expr.nullable()
 
     def prefix_markers(self):
         if self._prefix_markers is None:
@@ -567,7 +675,7 @@ class RegexPlus(Regex):
 
         return self._prefix_markers
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         return RegexConcat(self.expr.derive(ch, states, negate_states), RegexStar(self.expr))
 
     def __str__(self):
@@ -581,19 +689,20 @@ class RegexOpt(Regex):
     ν(r?) = ε (True)
 
     '''
+    __slots__ = ('expr',)
     sym = '?'
+    _children = ('expr',)
 
     def __new__(cls, expr, **kwargs):
-        key = (cls, expr, frozenset(kwargs.items()))
+        key = (cls, expr, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.expr = expr
             self.charset = self.expr.charset
+            self._isnullable = True
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        return RegexEpsilon()
 
     def prefix_markers(self):
         if self._prefix_markers is None:
@@ -601,7 +710,7 @@ class RegexOpt(Regex):
 
         return self._prefix_markers
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         return self.expr.derive(ch, states, negate_states)
 
     def __str__(self):
@@ -615,21 +724,26 @@ class RegexDot(Regex):
     ν(.) = 0 (False)
 
     '''
+    __slots__ = ('_alone',)
+    isdot = True
     sym = '.'
 
     def __new__(cls, **kwargs):
-        key = (cls, frozenset(kwargs.items()))
+        key = (cls, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.charset = CharSet(CHARSET_MAX - 1)
-            self.isdot = True
+            self._alone = frozenset((self,))
 
         return cls._intern(key, init)
 
     def derive(self, ch, states, negate_states=False):
         if not negate_states:
             states.add(self)
-        return RegexEpsilon()
+        return _EPSILON
+
+    def derivation(self, ch, negate_states=False):
+        return _EPSILON, _NOTHING if negate_states else self._alone
 
     def __str__(self):
         return RegexDot.sym
@@ -642,14 +756,16 @@ class RegexConcat(Regex):
     ν(r·s) = ν(r) & ν(s)
 
     '''
+    __slots__ = ('left', 'right', 'args')
     sym = '·'
+    _children = ('left', 'right')
 
     def __new__(cls, left, right, **kwargs):
         # 2) ∅·r ≈ ∅
         # 3) r·∅ ≈ ∅
         #
         if left.isempty or right.isempty:
-            return RegexEmpty()
+            return _EMPTY
 
         # 4) ε·r ≈ r
         #
@@ -661,57 +777,54 @@ class RegexConcat(Regex):
         if right.isepsilon:
             return left
 
-        args = [*Regex.get_args(left, RegexConcat), *Regex.get_args(right, RegexConcat)]
-        key = (cls, *args, frozenset(kwargs.items()))
+        args = Regex.get_args(left, RegexConcat) + Regex.get_args(right, RegexConcat)
+        key = (cls, *args, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.left = left
             self.right = right
-            if self.left.isnullable():
-                self.charset = self.left.charset & self.right.charset
+            self.args = args
+            self._isnullable = left._isnullable and right._isnullable
+            if left._isnullable:
+                self.charset = left.charset & right.charset
             else:
-                self.charset = self.left.charset
+                self.charset = left.charset
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        if self._nullable is None:
-            self._nullable = RegexAnd(self.left.nullable(), self.right.nullable())
-        return self._nullable
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         if self.left.ismarker:
             # Try the real derivative first
             #
-            rstates = set()
-            result = self.right.derive(ch, rstates, negate_states)
+            result, passed = self.right.derivation(ch, negate_states)
 
             # Only record the marker if this path succeeds
             if not result.isempty:
                 states.add(self.left)
-                states |= rstates
+                states |= passed
 
             return result
 
-        lstates = set()
-        left = RegexConcat(self.left.derive(ch, lstates, negate_states), self.right)
+        left, passed = self.left.derivation(ch, negate_states)
 
         # 1. We must be careful not to add any transition states that end up
-        # empty to our final state computation.
+        # empty to our final state computation. A concat is only ∅ if one
+        # side is, so this is just whether ∂ch(left) is.
         #
         if not left.isempty:
-            states |= lstates
+            states |= passed
+            left = RegexConcat(left, self.right)
 
-        right = RegexEmpty()
+        right = _EMPTY
 
-        if self.left.isnullable():
-            rstates = set()
-            right = RegexConcat(self.left.nullable(), self.right.derive(ch, rstates, negate_states=negate_states))
+        if self.left._isnullable:
+            right, passed = self.right.derivation(ch, negate_states)
 
             # 2. Same as 1.
             #
             if not right.isempty:
-                states |= rstates
+                states |= passed
                 states |= self.left.prefix_markers()
 
         result = RegexOr(left, right)
@@ -720,10 +833,13 @@ class RegexConcat(Regex):
 
     def prefix_markers(self):
         if self._prefix_markers is None:
-            out = set(self.left.prefix_markers())
-
-            if self.left.isnullable():
-                out |= self.right.prefix_markers()
+            # Over the flattened args, up to the first that can't be empty
+            #
+            out = set()
+            for arg in self.args:
+                out |= arg.prefix_markers()
+                if not arg._isnullable:
+                    break
 
             self._prefix_markers = out
 
@@ -741,18 +857,20 @@ class RegexDiff(Regex):
     ν(r-s) = ν(r) - ν(s)
 
     '''
+    __slots__ = ('left', 'right')
     sym = '-'
+    _children = ('left', 'right')
 
     def __new__(cls, left, right, **kwargs):
         # r - r = ∅
         #
         if left is right:
-            return RegexEmpty()
+            return _EMPTY
 
         # ∅ - r = ∅
         #
         if left.isempty:
-            return RegexEmpty()
+            return _EMPTY
 
         # r - ∅ = r
         #
@@ -767,22 +885,18 @@ class RegexDiff(Regex):
         # r - ¬∅ = ∅
         #
         if right.isany:
-            return RegexEmpty()
+            return _EMPTY
 
-        key = (cls, left, right, frozenset(kwargs.items()))
+        key = (cls, left, right, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.left = left
             self.right = right
+            self._isnullable = left._isnullable and not right._isnullable
             self.charset = self.left.charset & self.right.charset
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        if self._nullable is None:
-            self._nullable = RegexDiff(self.left.nullable(), self.right.nullable())
-
-        return self._nullable
 
     def prefix_markers(self):
         if self._prefix_markers is None:
@@ -790,7 +904,7 @@ class RegexDiff(Regex):
 
         return self._prefix_markers
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         return RegexDiff(self.left.derive(ch, states, negate_states), self.right.derive(ch, states, not negate_states))
 
     def __str__(self):
@@ -806,7 +920,10 @@ class RegexNot(Regex):
             0 if ν(r) = ε
 
     '''
+    __slots__ = ('expr', 'isany')
+    isnot = True
     sym = '~'
+    _children = ('expr',)
 
     def __new__(cls, expr, **kwargs):
         # ¬(¬r) ≈ r
@@ -814,26 +931,18 @@ class RegexNot(Regex):
         if expr.isnot:
             return expr.expr
 
-        key = (cls, expr, frozenset(kwargs.items()))
+        key = (cls, expr, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.expr = expr
             self.charset = self.expr.charset
             self.isany = self.expr.isempty
-            self.isnot = True
+            self._isnullable = not expr._isnullable
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        if self._nullable is None:
-            if self.expr.isnullable():
-                self._nullable = RegexEmpty()
-            else:
-                self._nullable = RegexEpsilon()
-
-        return self._nullable
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         return RegexNot(self.expr.derive(ch, states, not negate_states))
 
     def __str__(self):
@@ -844,7 +953,10 @@ class RegexExpr(Regex):
     '''
     Sub-expression denoted by parenthesis: (RE)
     '''
+    __slots__ = ('expr',)
+    isexpr = True
     sym = '()'
+    _children = ('expr',)
 
     def __new__(cls, expr, **kwargs):
         # ((r)) = (r)
@@ -860,24 +972,19 @@ class RegexExpr(Regex):
         # (∅) = ∅
         #
         if expr.isempty:
-            return RegexEmpty()
+            return _EMPTY
 
-        key = (cls, expr, frozenset(kwargs.items()))
+        key = (cls, expr, tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.expr = expr
             self.charset = self.expr.charset
-            self.isexpr = True
+            self._isnullable = expr._isnullable
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        if self._nullable is None:
-            self._nullable = self.expr.nullable()
-
-        return self._nullable
 
-    def derive(self, ch, states, negate_states=False):
+    def _derive(self, ch, states, negate_states=False):
         return RegexExpr(self.expr.derive(ch, states, negate_states))
 
     def prefix_markers(self):
@@ -894,25 +1001,28 @@ class RegexMarker(Regex):
     """
     A zero-width marker node that doesn't consume input but carries events.
     """
+    __slots__ = ('events',)
+    ismarker = True
     sym = '⟂'
 
     def __new__(cls, events=(), **kwargs):
-        key = (cls, tuple(events), frozenset(kwargs.items()))
+        key = (cls, tuple(events), tuple(sorted(kwargs.items())) if kwargs else ())
 
         def init(self):
             self.charset = CharSet(CHARSET_MAX - 1)
             self.events = events
-            self.ismarker = True
+            self._isnullable = True
             self._prefix_markers = {self}
 
         return cls._intern(key, init)
 
-    def nullable(self):
-        return RegexEpsilon()
 
     def derive(self, ch, states, negate_states=False):
         # Markers don't match characters
-        return RegexEmpty()
+        return _EMPTY
+
+    def derivation(self, ch, negate_states=False):
+        return _EMPTY, _NOTHING
 
     def prefix_markers(self):
         return self._prefix_markers
@@ -1020,14 +1130,11 @@ class CharSet:
         if not self.masks or not other.masks:
             return CharSet()
 
-        out = set()
-        for i in self.masks:
-            for j in other.masks:
-                mask = i & j
-                if mask:
-                    out.add(mask)
+        out = CharSet()
+        out.masks = {i & j for i in self.masks for j in other.masks}
+        out.masks.discard(0)
 
-        return CharSet(*out)
+        return out
 
 
     def get_int_sets(self):
@@ -1051,15 +1158,20 @@ class CharSet:
         """
         ints = []
 
+        # Each interval is a run of set bits, peeled off whole: lo is the
+        # lowest set bit, and the run's length the number of trailing ones
+        # from there.
+        #
         for mask in sorted(self.masks):
             charclass = []
             while mask:
-                lsb = mask & -mask
-                i = lsb.bit_length() - 1
-                mask &= ~lsb
-                charclass.append([i])
+                lo = (mask & -mask).bit_length() - 1
+                run = mask >> lo
+                length = (run ^ (run + 1)).bit_length() - 1
+                mask &= ~(((1 << length) - 1) << lo)
+                charclass.append([lo] if length == 1 else [lo, lo + length - 1])
 
-            ints.append(merge_intervals(charclass, merge_adjacent=True))
+            ints.append(charclass)
 
         return ints
 
@@ -1145,3 +1257,12 @@ def merge_intervals(intervals, merge_adjacent=False):
 
     return merged
 
+
+# The empty set and epsilon are needed all over, ∅ above all as the
+# derivative of almost everything; interning makes them singletons anyway,
+# so they are kept here rather than looked up on every use. (They can only
+# be made once CharSet is defined.)
+#
+_EMPTY = RegexEmpty()
+_NOTHING = frozenset()
+_EPSILON = RegexEpsilon()
@@ -1,5 +1,6 @@
 # pyre/test/test_basic.py
 
+import re
 import unittest
 import sys
 from pathlib import Path
@@ -8,6 +9,7 @@ ROOT = Path(__file__).resolve().parents[2]
 if str(ROOT) not in sys.path:
     sys.path.insert(0, str(ROOT))
 
+import pyre
 from test_common import RegexTestCase
 
 class TestLiterals(RegexTestCase):
@@ -71,6 +73,17 @@ class TestCharacterClasses(RegexTestCase):
         self.assert_fullmatch_same_as_re(pat, "m")
         self.assert_fullmatch_same_as_re(pat, "A")
 
+    def test_special_characters(self):
+        # ']' first and '-' first or last are literal; '^' only negates first
+        for pat in ["[]a]", "[^]a]", "[-a]", "[a-]", "[^-a]", "[a^]", "[a-c-]"]:
+            for text in ["a", "b", "]", "-", "^", "d"]:
+                self.assert_fullmatch_same_as_re(pat, text)
+
+    def test_invalid_classes(self):
+        for pat in ["[abc", "[a-c-e]", "[c-a]", "[ ]"]:
+            with self.assertRaises(ValueError, msg=pat):
+                pyre.compile(pat)
+
 
 class TestGroupsAndConcat(RegexTestCase):
     def test_simple_group(self):
@@ -98,5 +111,179 @@ class TestFloatingPoint(RegexTestCase):
         self.assert_fullmatch_same_as_re(pat, '+10')
         self.assert_fullmatch_same_as_re(pat, '1E10')
 
+class TestSearch(RegexTestCase):
+    def test_search_skips_dead_prefix(self):
+        pat = "ab+"
+        self.assert_search_same_as_re(pat, "xxxxxxxxab")
+        self.assert_search_same_as_re(pat, "xxxxxxxxa")
+        self.assert_search_same_as_re(pat, "")
+
+    def test_search_literal_prefix(self):
+        pat = r"foo\d+"
+        self.assert_search_same_as_re(pat, "fo foo foo12")
+        self.assert_search_same_as_re(pat, "fo foo fo12")
+        result = pyre.search(pat, "foo1 fofoo22 foo", all=True)
+        self.assertEqual(result[0], [(0, 4), (7, 12)])
+
+    def test_search_all_spans(self):
+        result = pyre.search("ab+", "ab xabb a abbb", all=True)
+        self.assertEqual(result[0], [(0, 2), (4, 7), (10, 14)])
+
+    def test_search_run_state(self):
+        # [^"]* loops on every byte but '"', so its runs are skipped in bulk
+        pat = '"[^"]*"'
+        self.assert_search_same_as_re(pat, 'xx "abc" "d"')
+        self.assert_search_same_as_re(pat, 'xx "' + "y" * 1000)
+        result = pyre.search(pat, '"" x "' + "y" * 1000 + '" "z', all=True)
+        self.assertEqual(result[0], [(0, 2), (5, 1007)])
+
+    def test_search_across_skip_blocks(self):
+        # Start bytes are skipped a block at a time; a match straddling
+        # the block boundary must still be found
+        block = pyre.dfa.SKIP_BLOCK
+        text = "x" * (block - 1) + "abbb" + "x" * block + "ab"
+        self.assert_search_same_as_re("ab+", text)
+        result = pyre.search("ab+", text, all=True)
+        self.assertEqual(result[0], [(block - 1, block + 3), (len(text) - 2, len(text))])
+
+    def test_failed_extension_leaves_no_groups(self):
+        # xyz gets as far as group 1 before w fails, so the match is x and
+        # group 1 must not take part
+        dfa = pyre.compile("x|xy(z)w")
+        self.assertEqual(dfa.search("xyzq"), {0: [(0, 1)]})
+        self.assertEqual(dfa.match("xyzq"), (1, {0: [(0, 1)]}))
+        self.assertEqual(dfa.search("xyzq xyzw", all=True), {0: [(0, 1), (5, 9)], 1: [(7, 8)]})
+
+    def test_search_empty_language(self):
+        # Minimization merges the initial state into the dead one; it must
+        # stay dead, so that every scan stops at once and every start byte
+        # is skipped
+        text = "x" * 8000 + "abc"
+        for pat in ["(?:a&b)c", "(a&b)c"]:
+            dfa = pyre.compile(pat)
+            if len(dfa.states) == 1:
+                self.assertEqual(dfa.dead, b"\x01", msg=pat)
+            self.assertEqual(set(dfa.skip_table), {1}, msg=pat)
+            self.assertEqual(dfa.search(text), {})
+            self.assertEqual(dfa.search(text, all=True), {})
+            self.assertEqual(dfa.fullmatch(""), {})
+            self.assertEqual(dfa.match("abc"), (None, {}))
+
+    def test_bytes_input(self):
+        dfa = pyre.compile("a(b+)")
+        for text in ["xabb ab", "caf\xe9 abbb"]:
+            data = text.encode('latin-1')
+            self.assertEqual(dfa.search(data), dfa.search(text))
+            self.assertEqual(dfa.search(data, all=True), dfa.search(text, all=True))
+        self.assertEqual(dfa.fullmatch(b"abb"), dfa.fullmatch("abb"))
+        self.assertEqual(dfa.match(bytearray(b"abx")), dfa.match("abx"))
+        self.assertEqual(dfa.search(memoryview(b"xab")), dfa.search("xab"))
+        for bad in [5, [97, 98], None]:
+            with self.assertRaises(TypeError, msg=repr(bad)):
+                dfa.search(bad)
+
+
+class TestParser(RegexTestCase):
+    def test_parsers_are_independent(self):
+        # Parsers share their tables but not their state
+        first, second = pyre.Parser(), pyre.Parser()
+        self.assertIsNone(first.parse("(a"))
+        self.assertIs(second.parse("(a)"), self.compile("(a)"))
+        self.assertEqual((first.errors, second.errors), (1, 0))
+        self.assertIs(first.parse("[a-c]"), self.compile("[a-c]"))
+        self.assertEqual(first.errors, 0)
+
+    def test_parser_errors_stay_separate(self):
+        # Later Parsers copy the first one's; each must report its own errors
+        parsers = [pyre.Parser() for _ in range(3)]
+        self.assertIsNone(parsers[2].parse("a)"))
+        self.assertEqual([parser.errors for parser in parsers], [0, 0, 1])
+        self.assertIsNone(parsers[0].parse("(a"))
+        self.assertIs(parsers[1].parse("a|b"), self.compile("a|b"))
+        self.assertEqual([parser.errors for parser in parsers], [1, 0, 1])
+
+    def test_parser_reuse(self):
+        # Group numbering starts afresh with every parse
+        parser = pyre.Parser()
+        for pat in ["(a)(b)", "(c)", "(?P<x>d)e"]:
+            self.assertIs(parser.parse(pat), self.compile(pat))
+
+    def test_parse_rejects_lexing_arguments(self):
+        parser = pyre.Parser()
+        for name in ["lexer", "tokenfunc"]:
+            with self.assertRaisesRegex(TypeError, name):
+                parser.parse("ab", **{name: None})
+        self.assertIs(parser.parse("ab"), self.compile("ab"))
+
+    def test_deep_concat(self):
+        # A long literal nests past the recursion limit
+        expr = self.compile("a" * 1100)
+        nodes = []
+        expr.walk(nodes.append)
+        self.assertEqual(len(nodes), 2199)
+        self.assertEqual(expr.tree().count('\n'), 2 * len(nodes) - 1)
+        self.assertEqual(expr.prefix_markers(), set())
+
+    def test_compile_in_threads(self):
+        from concurrent.futures import ThreadPoolExecutor
+        pats = [f"(x{{{i}}})(?P<n>[ab]+)" for i in range(1, 41)]
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            dfas = list(pool.map(pyre.compile, pats))
+        for pat, dfa in zip(pats, dfas):
+            self.assertIs(dfa, pyre.compile(pat))
+            text = "yy" + "x" * 50 + "abba"
+            m = re.search(pat, text)
+            result = dfa.search(text)
+            self.assertEqual((result[0], result[1]), ([m.span()], [m.span(1)]))
+
+
+class TestCompile(RegexTestCase):
+    def test_compile_is_cached(self):
+        self.assertIs(pyre.compile("a(b|c)"), pyre.compile("a(b|c)"))
+
+    def test_compile_expression_is_cached(self):
+        expr = self.compile("a(b|c)")
+        dfa = pyre.compile(expr)
+        self.assertIs(pyre.compile(self.compile("a(b|c)")), dfa)
+        self.assertEqual(dfa.search("xac"), {0: [(1, 3)], 1: [(2, 3)]})
+
+    def test_compile_passes_dfa_through(self):
+        dfa = pyre.compile("ab")
+        self.assertIs(pyre.compile(dfa), dfa)
+
+    def test_dfa_is_minimized(self):
+        # a*a* collapses to a* plus the dead state
+        self.assertEqual(len(pyre.compile("a*a*").states), 2)
+
+        # Second-to-last character is 'a': 4 live states plus dead
+        pat = "(?:a|b)*a(?:a|b)"
+        self.assertEqual(len(pyre.compile(pat).states), 5)
+        for s in ["ab", "aa", "ba", "bab", "abba", "bbbaa", "b", ""]:
+            self.assert_fullmatch_same_as_re(pat, s)
+
+    def test_byte_classes(self):
+        # '"' and every other byte are the only two distinct behaviours
+        dfa = pyre.compile('"[^"]*"')
+        self.assertEqual(len(set(dfa.classes)), 2)
+        self.assertEqual(len(dfa.trans[0]), 2)
+        self.assertNotEqual(dfa.classes[ord('"')], dfa.classes[ord('x')])
+
+    def test_kernels_share_code(self):
+        # Same shape, different characters: one compiled kernel, two tables
+        first, second = pyre.compile("ab+"), pyre.compile("cd+")
+        self.assertIs(first._scan_kernel.__code__, second._scan_kernel.__code__)
+        self.assertEqual(first.search("xabb cdd", all=True)[0], [(1, 4)])
+        self.assertEqual(second.search("xabb cdd", all=True)[0], [(5, 8)])
+
+    def test_invalid_pattern_not_cached(self):
+        for _ in range(2):
+            with self.assertRaises(ValueError):
+                pyre.compile("a{3,1}")
+
+    def test_syntax_error_on_plain_token(self):
+        for pat in ["a{1,2,3}", "a)", "a))", "(?P<x"]:
+            with self.assertRaises(ValueError, msg=pat):
+                pyre.compile(pat)
+
 if __name__ == "__main__":
     unittest.main()
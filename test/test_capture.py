@@ -102,6 +102,12 @@ class TestCaptureGroups(RegexTestCase):
         self.assertIn(0, result)
         self.assertEqual(result[0], [(0, 1)])
 
+    def test_group_names_not_shared(self):
+        """Same group in patterns differing only by name keeps its own name"""
+        for pattern, names in [("(a)", set()), ("(?P<x>a)", {"x"}), ("(?P<y>a)", {"y"})]:
+            result = pyre.fullmatch(pattern, "a")
+            self.assertEqual({k for k in result if isinstance(k, str)}, names)
+
 
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file
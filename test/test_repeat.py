@@ -31,6 +31,14 @@ class TestRepeat(RegexTestCase):
         self.assert_fullmatch_same_as_re("(ab){2}", "abab")
         self.assert_fullmatch_same_as_re("(ab){2}", "ababab")
 
+    def test_exact_repeat_zero_and_large(self):
+        # a{0} matches only the empty string; a{13} is built from doubled
+        # copies, which must still be exactly 13
+        for s in ["", "a"]:
+            self.assert_fullmatch_same_as_re("a{0}", s)
+        for n in [12, 13, 14]:
+            self.assert_fullmatch_same_as_re("a{13}", "a" * n)
+
     def test_bounded_repeat_literal(self):
         # a{2,4}
         pattern = "a{2,4}"